@@ -0,0 +1,75 @@
+import json
+import os
+
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/app_state.py
+#
+# Saved app state
+#
+# Mixin that lets an app keep its live state (timer deadlines, averaging windows...) across a reload or an
+# AppDaemon restart. terminate writes it to a small JSON file, the next initialize reads it back, so an off
+# timer keeps its deadline instead of starting over at the full delay.
+#
+# The file is <state_dir>/<app name>.json and is removed once it has been read. If AppDaemon stops without
+# running terminate (a crash) there is nothing to restore and the app starts the way it always did.
+#
+# Deadlines are saved as absolute times, DeadlineTimer.restore() re-arms the time that is left (a deadline
+# that passed while AppDaemon was down fires right away).
+#
+# Args (on the app using the mixin):
+#   state_dir: Folder the state files are kept in. Defaults to app_state in the AppDaemon config folder
+#
+# Usage:
+#   import app_state
+#
+#   class MyApp(app_state.SavedState, hass.Hass):
+#       def initialize(self):
+#           saved = self.load_saved_state() # {} when there is nothing saved
+#           if saved.get("deadline") is not None and self.get_state(self.light) == "on":
+#               self.timer.restore(saved["deadline"])
+#
+#       def terminate(self):
+#           self.save_state({"deadline": self.timer.deadline})
+#
+# This module is not an app, it does not need an entry in apps.yaml.
+
+
+class SavedState:
+    def state_path(self):
+        if "state_dir" in self.args:
+            directory = self.args["state_dir"]
+        else:
+            directory = os.path.join(self.config_dir, "app_state")
+        return os.path.join(directory, self.name + ".json")
+
+    def load_saved_state(self):
+        path = self.state_path()
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.log("Ignoring unreadable saved state {0} ({1})".format(path, e))
+            saved = {}
+        try:
+            os.remove(path) # Only restored once, see the header
+        except OSError:
+            pass
+        if not isinstance(saved, dict):
+            return {}
+        self.log("Restoring state saved at {0}".format(saved.get("saved_at")))
+        return saved.get("state", {})
+
+    def save_state(self, state):
+        path = self.state_path()
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            temp = path + ".tmp"
+            with open(temp, "w") as f:
+                json.dump({"saved_at": self.get_now_ts(), "state": state}, f)
+            os.replace(temp, path) # A half written file is never read
+        except OSError as e:
+            self.log("Couldn't save state to {0} ({1})".format(path, e))
@@ -0,0 +1,237 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import inspect
+
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/async_actions.py
+#
+# Async callbacks for the sync apps
+#
+# Mixin that turns callbacks of an app into async callbacks without rewriting them. AppDaemon runs async
+# callbacks on its event loop instead of a worker thread, so a slow HA doesn't hold a thread per callback.
+#
+# An async callback runs the normal (sync) callback code with every HA call it makes collected instead of
+# sent. Afterwards the timer and listener calls are run in order, and the service calls (turn_on, notify,
+# set_state...) are run concurrently, at most async_limit at a time. The decisions are made by exactly the
+# same code as the sync app, so switching an app between the two is only a change of class in apps.yaml.
+#
+# While collecting, run_in/listen_state return a placeholder handle that is filled in once the call has run.
+# cancel_timer/cancel_listen_state accept it. get_now_ts() and datetime() return the time the callback
+# started, read once before the callback runs.
+#
+# The callback code must only read state from local caches (entity_index, state_cache). A get_state call
+# can't return a value until the callback is done, so it raises RuntimeError instead of returning something
+# that isn't the state.
+#
+# Disk I/O doesn't belong on the event loop either. Callback code wraps it in blocking(function, *args), which
+# runs it right away outside async callbacks and on a worker thread after the callback has run inside one.
+# Those calls run one at a time, in the order they were made, so appends to a file stay in order.
+#
+# Args (on the app using the mixin):
+#   async_limit: Maximum number of service calls running at the same time. Defaults to 4
+#
+# Usage:
+#   import async_actions
+#
+#   class AsyncMyApp(async_actions.AsyncActions, MyApp):
+#       def initialize(self):
+#           self.setup_async("motion_callback", "condition_callback")
+#           super().initialize()
+#           self.async_timer(self.timer_handle) # DeadlineTimer callbacks
+#
+# This module is not an app, it does not need an entry in apps.yaml.
+
+SERVICE_CALLS = ("call_service", "turn_on", "turn_off", "toggle", "notify", "set_state")
+HANDLE_CALLS = ("run_in", "run_every", "run_daily", "listen_state", "listen_event")
+CANCEL_CALLS = ("cancel_timer", "cancel_listen_state", "cancel_listen_event")
+CLOCK_CALLS = ("get_now_ts", "datetime")
+READ_CALLS = ("get_state", "entity_exists", "render_template")
+
+# Batch of the callback that is currently collecting, None outside async callbacks. Each asyncio task
+# has its own value, so callbacks running at the same time don't mix their calls
+COLLECTING = contextvars.ContextVar("async_actions_collecting", default=None)
+
+# Runs the blocking() calls of every async app, one at a time
+BLOCKING = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="async_actions")
+
+
+class Handle:
+    # Stands in for a timer or listener handle until the call that creates it has run
+    def __init__(self):
+        self.handle = None
+
+
+class Batch:
+    def __init__(self, clock):
+        self.clock = clock # Clock call name -> value when the callback started
+        self.ordered = [] # (function, args, kwargs, Handle or None), run one after the other
+        self.services = [] # (function, args, kwargs), run concurrently
+        self.blocking = [] # (function, args, kwargs), run in order on the BLOCKING thread
+
+
+class AsyncActions:
+    def setup_async(self, *callbacks):
+        # First thing in initialize, before setup_instrumentation and any callback registration
+        self.async_limit = int(self.args.get("async_limit", 4))
+        self.async_clock = {}
+        for name in SERVICE_CALLS:
+            setattr(self, name, self.collect_service(getattr(self, name)))
+        for name in HANDLE_CALLS:
+            setattr(self, name, self.collect_handle(getattr(self, name)))
+        for name in CANCEL_CALLS:
+            setattr(self, name, self.collect_cancel(getattr(self, name)))
+        for name in CLOCK_CALLS:
+            self.async_clock[name] = getattr(self, name)
+            setattr(self, name, self.collect_clock(name, getattr(self, name)))
+        for name in READ_CALLS:
+            setattr(self, name, self.refuse_read(name, getattr(self, name)))
+        for name in callbacks:
+            setattr(self, name, self.async_callback(getattr(self, name)))
+
+    def async_callback(self, function):
+        # Async version of a sync callback
+        @functools.wraps(function)
+        async def callback(*args, **kwargs):
+            await self.run_async(function, *args, **kwargs)
+        return callback
+
+    def async_timer(self, timer):
+        # Makes a DeadlineTimer (see deadline_timer.py) fire as an async callback from now on
+        timer.timer_callback = self.async_callback(timer.timer_callback)
+
+    async def run_async(self, function, *args, **kwargs):
+        clock = {}
+        for name, read in self.async_clock.items():
+            clock[name] = await resolve(read())
+        batch = Batch(clock)
+        token = COLLECTING.set(batch)
+        try:
+            function(*args, **kwargs)
+        finally:
+            COLLECTING.reset(token)
+        blocking = None
+        if batch.blocking: # Queued before anything is awaited, so the order of the callbacks is kept
+            blocking = asyncio.get_running_loop().run_in_executor(BLOCKING, run_all, batch.blocking)
+        await self.run_batch(batch)
+        if blocking is not None:
+            try:
+                await blocking
+            except Exception as e:
+                self.error("Blocking call failed: {0!r}".format(e))
+
+    async def run_batch(self, batch):
+        for function, args, kwargs, handle in batch.ordered:
+            result = await resolve(function(*args, **kwargs))
+            if handle is not None:
+                handle.handle = result
+
+        if not batch.services:
+            return
+        semaphore = asyncio.Semaphore(self.async_limit)
+
+        async def call(function, args, kwargs):
+            async with semaphore:
+                await resolve(function(*args, **kwargs))
+
+        results = await asyncio.gather(*(call(*s) for s in batch.services), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                self.error("Service call failed: {0!r}".format(result))
+
+    #
+    # Wrappers, they only change anything while a callback is collecting
+    #
+
+    def collect_service(self, function):
+        @functools.wraps(function)
+        def collected(*args, **kwargs):
+            batch = COLLECTING.get()
+            if batch is None:
+                return function(*args, **kwargs)
+            batch.services.append((function, args, kwargs))
+        return collected
+
+    def collect_handle(self, function):
+        @functools.wraps(function)
+        def collected(*args, **kwargs):
+            batch = COLLECTING.get()
+            if batch is None:
+                return function(*args, **kwargs)
+            handle = Handle()
+            batch.ordered.append((function, args, kwargs, handle))
+            return handle
+        return collected
+
+    def collect_cancel(self, function):
+        @functools.wraps(function)
+        def collected(handle, *args, **kwargs):
+            batch = COLLECTING.get()
+            if batch is None:
+                handle = real_handle(handle)
+                if handle is None:
+                    return False
+                return function(handle, *args, **kwargs)
+            batch.ordered.append((cancel_later(function, handle), args, kwargs, None))
+        return collected
+
+    def refuse_read(self, name, function):
+        @functools.wraps(function)
+        def read(*args, **kwargs):
+            if COLLECTING.get() is not None:
+                raise RuntimeError("{0} can't return a value inside an async callback, read from entity_index or state_cache".format(name))
+            return function(*args, **kwargs)
+        return read
+
+    def collect_clock(self, name, function):
+        @functools.wraps(function)
+        def collected(*args, **kwargs):
+            batch = COLLECTING.get()
+            if batch is None or args or kwargs:
+                return function(*args, **kwargs)
+            return batch.clock[name]
+        return collected
+
+
+def blocking(function, *args, **kwargs):
+    # Disk I/O and other blocking work, see the header. Returns the result only outside async callbacks
+    batch = COLLECTING.get()
+    if batch is None:
+        return function(*args, **kwargs)
+    batch.blocking.append((function, args, kwargs))
+
+
+async def in_executor(function, *args, **kwargs):
+    # Blocking work from native async code (endpoints, async callbacks), after the queued blocking() calls
+    return await asyncio.get_running_loop().run_in_executor(BLOCKING, functools.partial(function, *args, **kwargs))
+
+
+def run_all(calls):
+    for function, args, kwargs in calls:
+        function(*args, **kwargs)
+
+
+def real_handle(handle):
+    if isinstance(handle, Handle):
+        return handle.handle
+    return handle
+
+
+def cancel_later(function, handle):
+    # The placeholder is only filled in when the batch runs, so the real handle is looked up then
+    def cancel(*args, **kwargs):
+        real = real_handle(handle)
+        if real is None:
+            return False
+        return function(real, *args, **kwargs)
+    return cancel
+
+
+async def resolve(result):
+    # AppDaemon API calls made on the event loop return something to await, fakehass may return plain values
+    if inspect.isawaitable(result):
+        return await result
+    return result
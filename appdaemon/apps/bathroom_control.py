@@ -1,8 +1,12 @@
 import hassapi as hass
+import instrumentation
+import recorder
 import collections
-from datetime import datetime
+import deadline_timer
+import ha_log
+import app_state
 
-__version__ = "2022-12-11"
+__version__ = "2026-10-18"
 
 #
 # source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/bathroom_control.py
@@ -18,24 +22,40 @@ __version__ = "2022-12-11"
 #
 #   Optional:
 #     delay: amount of time in seconds to wait to turn off bathroom fan. If not specified defaults to 600 seconds (10 Minutes)
-#     humidity: Humidity sensor entity
+#     humidity: Humidity sensor entity (leave out if the room is in a HumidityEngine, see humidity_engine.py)
+#     humidity_window: Length in seconds of the window the humidity is averaged over. Defaults to 900 seconds (15 Minutes)
+#     humidity_threshold: How far above the average the humidity has to rise to trigger the fan. Defaults to 5
 #     presence: Presence sensor (Will not turn on fan unless this is set to "home")
-#     halogging: (Enable Logging to HA Entity)
+#     halogging: (Enable Logging to HA Entity, buffered and written in batches, see ha_log.py)
+#
+# The fan timers and the humidity window are kept across reloads and restarts (see app_state.py)
+#
+# Without the humidity arg the app listens for ENGINE_EVENT from a HumidityEngine instead, so the trigger
+# runs on this app's own thread like its other callbacks.
 
-class bathroom_fan_control(hass.Hass):
+# Event a HumidityEngine fires when the humidity of a bathroom rises, data: {"app": bathroom app name}
+ENGINE_EVENT = "humidity_engine_trigger"
+
+class bathroom_fan_control(app_state.SavedState, recorder.Recorder, instrumentation.Instrumentation, hass.Hass):
     def initialize(self):
+        # Opt-in callback timing (see instrumentation.py), has to run before any callback is registered
+        self.setup_instrumentation("humidity_callback", "light_callback", "fan_callback", "timer_callback", "backup_timer_callback",
+            "engine_trigger_callback")
+        self.setup_recorder() # Opt-in callback and action recording (see recorder.py)
+
         required = ["light", "fan"]
         for a in required:
             if not a in self.args:
                 self.log("Error loading, required argument '{0}' not defined".format(a))
                 return
             
-        # Create a variable to store the timer handle
-        self.timer_handle = None # Main timer
-        self.backup_timer = None # Backup timer
+        # Fan off timers, restarting them only pushes back their deadline (see deadline_timer.py)
+        self.timer_handle = deadline_timer.DeadlineTimer(self, self.timer_callback) # Main timer
+        self.backup_timer = deadline_timer.DeadlineTimer(self, self.backup_timer_callback) # Backup timer
         
         if "halogging" in self.args:
             self.halogging = True
+            self.ha_log = ha_log.LogSink(self)
         else:
             self.halogging = False
         
@@ -47,15 +67,36 @@ class bathroom_fan_control(hass.Hass):
 
         self.light = self.args["light"]
         self.fan = self.args["fan"]
+
+        saved = self.load_saved_state() # State from before a reload, {} if there is none
         
         if "humidity" in self.args:
             self.humidity_entity = self.args["humidity"]
             self.log("Found humidity sensor, starting built in trend sensor")
-            reading = float(self.get_state(self.humidity_entity)) # Get current humidity to populate the deque with
-            self.hum_readings = collections.deque(60 * [reading], maxlen=60) #60 = 15 minutes, 4 readings every minute
-            self.run_every(self.sensor_loop, "now",  15) #Run loop every 15 seconds
+
+            if "humidity_window" in self.args:
+                window = int(self.args["humidity_window"])
+            else:
+                window = 900 # 15 Minutes
+
+            if "humidity_threshold" in self.args:
+                self.humidity_threshold = float(self.args["humidity_threshold"])
+            else:
+                self.humidity_threshold = 5
+
+            self.trend = HumidityTrend(window)
+            reading = parse_reading(self.get_state(self.humidity_entity))
+            if "trend" in saved:
+                # Carry on with the window from before the reload, the current reading takes over from now
+                self.trend.restore(saved["trend"])
+                self.trend.update(self.get_now_ts(), reading)
+            elif reading is not None:
+                # Fill the window with the current humidity so the average starts out flat
+                self.trend.update(self.get_now_ts() - window, reading)
+            self.listen_state(self.humidity_callback, self.humidity_entity)
         else:
             self.humidity_entity = False
+            self.listen_event(self.engine_trigger_callback, ENGINE_EVENT, app=self.name) # Trend from a HumidityEngine
 
         if "presence" in self.args:
             self.presence_entity = self.args["presence"]
@@ -66,32 +107,31 @@ class bathroom_fan_control(hass.Hass):
         self.listen_state(self.light_callback, entity_id=self.light)
         self.listen_state(self.fan_callback, entity_id=self.fan)
 
-        if self.get_state(self.fan) == "on" and self.get_state(self.light) == "off":
+        fan_on = self.get_state(self.fan) == "on"
+        if fan_on and (saved.get("deadline") is not None or saved.get("backup_deadline") is not None):
+            # Timers from before the reload, only the time they had left
+            if saved.get("deadline") is not None:
+                self.timer_handle.restore(saved["deadline"])
+            if saved.get("backup_deadline") is not None:
+                self.backup_timer.restore(saved["backup_deadline"])
+            self.halog("Startup: Fan is on, restored fan timers")
+        elif fan_on and self.get_state(self.light) == "off":
             # Start timer to clean up fan on restart. The timer will not be going since this is initial load
             self.halog("Startup: Fan is on and the light is off. Starting fan shutdown timer")
-            self.timer_handle = self.run_in(self.timer_callback, self.delay)
+            self.restart_normal()
     
-    def sensor_loop(self, kwargs):
-        try:
-            reading = float(self.get_state(self.humidity_entity))
-        except ValueError: 
-            reading = 0 # The sensor is unavailable, set to zero to avoid errors 
+    def humidity_callback(self, entity, attribute, old, new, kwargs):
+        now = self.get_now_ts()
+        reading = parse_reading(new) # None while the sensor is unavailable
 
-        # # Calculate average of 30 oldest readings
-        # s = 0
-        # for i in range (0, 30):
-        #     s = s + self.hum_readings[i]
-        # past_average = s / 30
-        # self.log(s)
+        if reading is not None:
+            average = self.trend.mean(now)
+            if average is not None:
+                change = round(reading - average, 2)
+                if change > self.humidity_threshold: #If humidity has risen over the average, trigger the fan
+                    self.hum_trigger()
 
-        # Calculate average from full deque
-        average = round(sum(self.hum_readings) / len(self.hum_readings), 2)
-        change = round(reading - average, 2)
-
-        if change > 5: #If humidity has risen 5 degrees over the average, trigger the fan
-            self.hum_trigger()
-
-        self.hum_readings.append(reading) # Add reading to deque
+        self.trend.update(now, reading)
 
     def light_callback(self, entity, attribute, old, new, kwargs):
         self.log(self.get_state(self.fan))
@@ -110,9 +150,9 @@ class bathroom_fan_control(hass.Hass):
                 self.restart_backup()
 
     def fan_callback(self, entity, attribute, old, new, kwargs):
-        if new == "on" and old == "off" and not self.backup_timer:
+        if new == "on" and old == "off" and not self.backup_timer.active:
             self.halog("Detected manual fan activation")
-            self.timer_handle = self.run_in(self.backup_timer_callback, 3600) #One hour safety timer
+            self.restart_backup() #One hour safety timer
         
         if new == "off" and old == "on":
             # Cancel all timers if they aren't already cancelled, the fan may have been turned off manually
@@ -120,21 +160,18 @@ class bathroom_fan_control(hass.Hass):
             self.cancel_normal()
 
     def timer_callback(self, kwargs):
-        self.timer_handle = None
         self.halog("Turning off fan from main timer")
-        if self.backup_timer: #Cancel the backup timer regardless
-            self.cancel_timer(self.backup_timer)
-            self.backup_timer = None
+        self.cancel_backup() #Cancel the backup timer regardless
         self.turn_off(self.fan)
     
     def backup_timer_callback(self, kwargs):
-        self.backup_timer = None
         self.halog("Turning off fan from backup timer")
-        if self.timer_handle: #Cancel the main timer
-            self.cancel_timer(self.timer_handle)
-            self.timer_handle = None
+        self.cancel_normal() #Cancel the main timer
         self.turn_off(self.fan)
 
+    def engine_trigger_callback(self, event_name, data, kwargs):
+        self.hum_trigger()
+
     def hum_trigger(self):
         fanstate = self.get_state(self.fan)
         anyone_home = self.get_state(self.presence_entity)
@@ -146,46 +183,150 @@ class bathroom_fan_control(hass.Hass):
         # The fan will be turned off from the light, motion, or backup timer.
 
     def restart_backup(self):
-        if self.backup_timer: #Restart backup timer
-            self.cancel_timer(self.backup_timer)
-        self.backup_timer = self.run_in(self.backup_timer_callback, 3600) #One hour safety timer
+        self.backup_timer.restart(3600) #One hour safety timer
 
     def restart_normal(self):
-        if self.timer_handle: #Reset normal timer
-            self.cancel_timer(self.timer_handle)
-        self.timer_handle = self.run_in(self.timer_callback, self.delay)
+        self.timer_handle.restart(self.delay)
     
     def cancel_backup(self):
-        if self.backup_timer:
-            self.cancel_timer(self.backup_timer)
-            self.backup_timer = None
+        self.backup_timer.cancel()
     
     def cancel_normal(self):
-        if self.timer_handle:
-            self.cancel_timer(self.timer_handle)
-            self.timer_handle = None
+        self.timer_handle.cancel()
+
+    def terminate(self):
+        if hasattr(self, "timer_handle"): # Not set if initialize stopped on a missing arg
+            saved = {"deadline": self.timer_handle.deadline, "backup_deadline": self.backup_timer.deadline}
+            if getattr(self, "humidity_entity", False):
+                saved["trend"] = self.trend.save(self.get_now_ts())
+            self.save_state(saved)
+        if getattr(self, "halogging", False):
+            self.ha_log.flush() # Write out anything still buffered
+        self.stop_recorder()
 
     def halog(self, msg):
         # Hacky method to get logs from AD into HA
-        # Use a logbook viewer on the sensor.adlog entity to see the logs
+        # The newest line is the state of sensor.adlog, the last batch is in its "lines" attribute (see ha_log.py)
         if self.halogging: #Only log to HA if enabled, otherwise just log to normal log
             self.log("[HALOG] - "+ msg)
-            icon = "mdi:google-cardboard"
-            attributes = {"source": "AppDaemon", "icon": icon, "friendly_name": "AppDaemon Log"} 
-            now = datetime.now() # current date and time
-            time = now.strftime("%H:%M:%S")
-
-            msg = "[{0}] {1}  ({2})".format(self.name, msg, time)
-            self.set_state("sensor.adlog", state=msg, attributes=attributes)
+            self.ha_log.log(msg) # Buffered, written to sensor.adlog in batches
         else:
             self.log(msg) #If HA logging is disabled, log to normal AD without the added text
 
 
+def parse_reading(state):
+    # Converts a humidity state to a float, returns None if the sensor is unavailable or not a number
+    try:
+        return float(state)
+    except (ValueError, TypeError):
+        return None
 
-       
-        
 
-    
+class HumidityTrend:
+    # Time weighted average and variance of a sensor over a sliding window
+    #
+    # Each reading counts for as long as it was the current value, so a sensor that only reports on change
+    # is averaged correctly without polling. Periods where the sensor is unavailable are left out of the
+    # window instead of being counted as zero.
+    # Running sums are kept for the closed readings so every update is O(1) (amortized)
 
-       
-        
+    def __init__(self, window):
+        self.window = window
+        self.segments = collections.deque() # Closed readings: [start, end, value]
+        self.total = 0.0 # Sum of value * seconds over the closed readings
+        self.total_sq = 0.0 # Sum of value^2 * seconds
+        self.duration = 0.0 # Seconds covered by the closed readings
+        self.current = None # Reading currently held, None while unavailable
+        self.since = None # Time the current reading arrived
+
+    def update(self, now, value):
+        # Close the reading that was held until now and start holding the new one
+        if self.current is not None and now > self.since:
+            self.add(self.since, now, self.current)
+        self.current = value
+        self.since = now
+        self.expire(now)
+
+    def save(self, now):
+        # Window contents as plain lists, for app_state. The held reading is closed at now so the time
+        # AppDaemon is down is left out like an unavailable sensor
+        segments = [list(segment) for segment in self.segments]
+        if self.current is not None and now > self.since:
+            segments.append([self.since, now, self.current])
+        return segments
+
+    def restore(self, segments):
+        self.segments.clear()
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.duration = 0.0
+        for start, end, value in segments:
+            self.add(start, end, value)
+        self.current = None
+        self.since = None
+
+    def mean(self, now):
+        stats = self.stats(now)
+        if stats is None:
+            return None
+        return stats[0]
+
+    def variance(self, now):
+        stats = self.stats(now)
+        if stats is None:
+            return None
+        return stats[1]
+
+    def stats(self, now):
+        # Returns (mean, variance) over the window ending at now, or None if there is no data in the window
+        self.expire(now)
+        total = self.total
+        total_sq = self.total_sq
+        duration = self.duration
+
+        if self.current is not None:
+            # Include the reading that is still being held
+            start = max(self.since, now - self.window)
+            held = now - start
+            if held > 0:
+                total += self.current * held
+                total_sq += self.current * self.current * held
+                duration += held
+
+        if duration <= 0:
+            if self.current is not None:
+                return (self.current, 0.0)
+            return None
+
+        mean = total / duration
+        variance = max(total_sq / duration - mean * mean, 0.0)
+        return (mean, variance)
+
+    def add(self, start, end, value):
+        self.segments.append([start, end, value])
+        seconds = end - start
+        self.total += value * seconds
+        self.total_sq += value * value * seconds
+        self.duration += seconds
+
+    def expire(self, now):
+        start = now - self.window
+        while self.segments and self.segments[0][1] <= start:
+            seg_start, seg_end, value = self.segments.popleft()
+            self.subtract(value, seg_end - seg_start)
+
+        if self.segments and self.segments[0][0] < start:
+            # Oldest reading is partly outside the window, trim it
+            self.subtract(self.segments[0][2], start - self.segments[0][0])
+            self.segments[0][0] = start
+
+        if not self.segments:
+            # Reset to avoid floating point drift from repeated subtraction
+            self.total = 0.0
+            self.total_sq = 0.0
+            self.duration = 0.0
+
+    def subtract(self, value, seconds):
+        self.total -= value * seconds
+        self.total_sq -= value * value * seconds
+        self.duration -= seconds
@@ -1,7 +1,14 @@
 import hassapi as hass
+import instrumentation
+import recorder
 import datetime
+import entity_index
+import battery_history
+import async_actions
+import os
+import threading
 
-__version__ = "2023-01-16"
+__version__ = "2026-10-18"
 
 #
 #
@@ -19,13 +26,24 @@ __version__ = "2023-01-16"
 # excluded:
 #   - excluded_entity_id
 #   - excluded_entity_id
+# history_dir = Folder the battery level history is kept in. Defaults to battery_history in the AppDaemon config folder
+# history_days = Days of history used for the discharge forecast after a restart. Defaults to 90
+#
+# The battery level history is used to estimate how many days each battery has left, which is added to
+# sensor.battery_tracker as the days_until_empty attribute (see battery_history.py).
+#
+# class: AsyncBattery instead of Battery runs the callbacks on AppDaemon's event loop (see async_actions.py)
 #
 # Source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/battery.py
 # Uses some code from: https://raw.githubusercontent.com/AppDaemon/appdaemon/dev/conf/example_apps/battery.py
 
 
-class Battery(hass.Hass):
+class Battery(recorder.Recorder, instrumentation.Instrumentation, hass.Hass):
     def initialize(self):
+        # Opt-in callback timing (see instrumentation.py), has to run before any callback is registered
+        self.setup_instrumentation("state_changed", "battery_callback", "check_batteries")
+        self.setup_recorder() # Opt-in callback and action recording (see recorder.py)
+
         required = ["notifier"]
         for a in required:
             if not a in self.args:
@@ -55,16 +73,102 @@ class Battery(hass.Hass):
             elif type(ex) == list:
                 self.excluded = ex
 
+        if "history_dir" in self.args:
+            history_dir = self.args["history_dir"]
+        else:
+            history_dir = os.path.join(self.config_dir, "battery_history")
+        self.history = battery_history.HistoryStore(history_dir)
+
+        if "history_days" in self.args:
+            self.history_days = float(self.args["history_days"])
+        else:
+            self.history_days = 90
+
+        self.index = entity_index.attach(self) # Shared device list, see entity_index.py
+
+        # Table of normalized battery levels, seeded from the index snapshot and kept current by battery_callback
+        self.levels = {}
+        self.rates = {} # Discharge rate per device, fed the same readings as the history
+        self.loading = {} # Device -> readings that came in while its history file is read, see load_history
+        self.rate_lock = threading.Lock()
         devices = self.find_devices()
         for d in devices:
-            self.listen_state(self.battery_callback, d)
+            self.add_device(d, self.index.get(d))
+
+        # One subscription for every battery instead of a listen_state per device, state_changed filters on this set.
+        # Batteries that show up later are added to it by state_changed
+        self.batteries = frozenset(devices)
+        self.listen_event(self.state_changed, "state_changed")
 
         if "onrestart" in self.args:
-            self.check_batteries(self)
+            self.run_in(self.check_batteries, 0)
+
+    def terminate(self):
+        entity_index.detach(self)
+        self.stop_recorder()
+
+    def add_device(self, device, state):
+        # Seeds the level table and the discharge rate (from the history file) of a device
+        self.levels[device] = self.normalize_levels(state["state"] if state else None)
+        with self.rate_lock:
+            self.rates[device] = battery_history.DischargeRate()
+            self.loading[device] = []
+        since = self.get_now_ts() - self.history_days * battery_history.DAY
+        async_actions.blocking(self.load_history, device, since) # File read, off the event loop in AsyncBattery
+
+    def load_history(self, device, since):
+        # Readings recorded while the file was read are added after the history, so the rate sees them in order.
+        # Their appends are queued behind this read, so they aren't in the file yet
+        rate = battery_history.DischargeRate()
+        for timestamp, level in self.history.read(device, start=since):
+            rate.add(timestamp, level)
+        with self.rate_lock:
+            pending = self.loading.pop(device, None)
+            if pending is None:
+                return # Removed while loading
+            for timestamp, level in pending:
+                rate.add(timestamp, level)
+            self.rates[device] = rate
+
+    def state_changed(self, event_name, data, kwargs):
+        entity = data.get("entity_id")
+        old_state = data.get("old_state")
+        new_state = data.get("new_state")
+
+        if not entity in self.batteries:
+            if new_state is None or entity in self.excluded or entity_index.device_class_of(new_state) != "battery":
+                return
+            # New battery (or an entity that just got the battery device class)
+            self.log("Found new battery device: "+entity)
+            self.add_device(entity, None)
+            self.batteries = self.batteries | {entity}
+            old_state = None
+
+        if new_state is None or entity_index.device_class_of(new_state) != "battery":
+            # Entity removed from HA, or it isn't a battery anymore
+            if new_state is not None:
+                self.log("Battery device lost its battery class: "+entity)
+            self.batteries = self.batteries - {entity}
+            self.levels.pop(entity, None)
+            with self.rate_lock:
+                self.rates.pop(entity, None)
+                self.loading.pop(entity, None)
+            return
+
+        old = old_state["state"] if old_state else None
+        new = new_state["state"]
+        if old != new: # Attribute only changes are ignored, same as listen_state
+            self.battery_callback(entity, "state", old, new, kwargs)
+
+    def record_tracks(self, entity, new_state):
+        # Recorder filter for state_changed (see recorder.py), the batteries and entities that may become one
+        return entity in self.batteries or entity_index.device_class_of(new_state) == "battery"
 
     def battery_callback(self, entity, attribute, old, new, kwargs):
         old = self.normalize_levels(old)
         new = self.normalize_levels(new)
+        self.levels[entity] = new
+        self.record_level(entity, new)
 
         if old and new:  # Verify that neither is None
             # If the battery went up and it started below the threshold, and not an excluded device
@@ -75,16 +179,24 @@ class Battery(hass.Hass):
                 self.notify(message, title="Battery Report",
                             name=self.notifier)
 
+    def record_level(self, device, level):
+        # Adds a reading to the history file and the discharge rate of the device
+        if level is None:
+            return
+        now = self.get_now_ts()
+        async_actions.blocking(self.history.append, device, now, level) # File append, off the event loop in AsyncBattery
+        with self.rate_lock:
+            if device in self.loading:
+                self.loading[device].append((now, level))
+            else:
+                self.rates.setdefault(device, battery_history.DischargeRate()).add(now, level)
+
     def find_devices(self):
         # Find devices with battery class and return list
-        hastate = self.get_state()
         devices = []
-        for device in hastate:
-            try:
-                if hastate[device]["attributes"]["device_class"] == "battery" and not device in self.excluded:
-                    devices.insert(0, device)
-            except KeyError:
-                pass
+        for device in self.index.by_device_class("battery"):
+            if not device in self.excluded:
+                devices.append(device)
         return devices
 
     def normalize_levels(self, level):
@@ -113,21 +225,25 @@ class Battery(hass.Hass):
         values = {}  # Dict of all battery levels
         low = []  # List of devices that are low
         invalid = []  # List of devices with invalid battery states
+        forecast = {}  # Dict of estimated days until empty
 
-        devices = self.find_devices()
-        for device in devices:
-            cleanlevel = self.normalize_levels(self.get_state(device))
-
+        # Levels come from the local table, no calls to HA needed
+        for device, cleanlevel in self.levels.items():
             if cleanlevel is not None:
                 if cleanlevel < int(self.threshold):
                     low.append(device)
                 values[device] = cleanlevel
+                self.record_level(device, cleanlevel) # Daily sample, so the forecast sees flat periods too
+                days = self.rates[device].days_until_empty()
+                if days is not None:
+                    forecast[device] = round(days, 1)
             else:
                 invalid.append(device)
 
         state = self.datetime().strftime("Updated %I:%M:%S %p")  # current date and time
         attributes = {"battery_levels": values,
-                      "low_batteries": low, "invalid_devices": invalid}
+                      "low_batteries": low, "invalid_devices": invalid,
+                      "days_until_empty": forecast}
         self.set_state("sensor.battery_tracker",
                        state=state, attributes=attributes)
 
@@ -144,3 +260,9 @@ class Battery(hass.Hass):
                         name=self.notifier)
             if invalid:
                 self.log("Invalid devices: {0}, Excluded Devices {1}".format(invalid, self.excluded))
+
+
+class AsyncBattery(async_actions.AsyncActions, Battery):
+    def initialize(self):
+        self.setup_async("state_changed", "check_batteries")
+        super().initialize()
@@ -0,0 +1,131 @@
+import bisect
+import mmap
+import os
+import struct
+
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/battery_history.py
+#
+# Battery level history and discharge forecast
+#
+# HistoryStore keeps one append-only file per device under `directory`, made of fixed-width records
+# (timestamp as a double, level as a float, 12 bytes). Appending writes one record at the end of the file,
+# reading a time range maps the file with mmap and binary searches the timestamps, so nothing is parsed
+# or loaded that isn't needed.
+#
+# DischargeRate is a least-squares fit of level against time over the current discharge (it starts over
+# when the level jumps up by RESET_JUMP or more, after a battery change, smaller rises are reporting jitter).
+# It keeps running sums, so adding a reading is O(1) and nothing is rescanned. days_until_empty() extends
+# the fitted line from the last reading down to 0%.
+#
+# Usage:
+#   import battery_history
+#
+#   self.history = battery_history.HistoryStore(os.path.join(self.config_dir, "battery_history"))
+#   self.history.append(entity, self.get_now_ts(), level)
+#   self.history.read(entity, start=self.get_now_ts() - 86400) # [(timestamp, level)] for the last day
+#
+#   rate = battery_history.DischargeRate()
+#   for ts, level in self.history.read(entity):
+#       rate.add(ts, level)
+#   rate.days_until_empty()
+#
+# This module is not an app, it does not need an entry in apps.yaml.
+
+RECORD = struct.Struct("<df") # timestamp, level
+DAY = 86400
+MIN_SPAN = 2 * DAY # Don't forecast from less than two days of readings, sensor noise makes it useless
+RESET_JUMP = 10 # Level rise (points) that means the battery was charged or replaced
+
+
+class HistoryStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, entity):
+        return os.path.join(self.directory, entity + ".bin")
+
+    def append(self, entity, timestamp, level):
+        with open(self.path(entity), "ab") as f:
+            f.write(RECORD.pack(timestamp, level))
+
+    def read(self, entity, start=None, end=None):
+        # Returns [(timestamp, level)] with start <= timestamp < end, oldest first
+        try:
+            f = open(self.path(entity), "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            count = size // RECORD.size # A partly written last record is ignored
+            if count == 0:
+                return [] # Can't mmap an empty file
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                times = RecordTimes(data, count)
+                first = 0 if start is None else bisect.bisect_left(times, start)
+                last = count if end is None else bisect.bisect_left(times, end)
+                return [RECORD.unpack_from(data, i * RECORD.size) for i in range(first, last)]
+
+
+class RecordTimes:
+    # Sequence view of the timestamps in a mapped history file, for bisect
+    def __init__(self, data, count):
+        self.data = data
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return RECORD.unpack_from(self.data, i * RECORD.size)[0]
+
+
+class DischargeRate:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.origin = None # Time of the first reading, sums use days since then to keep the numbers small
+        self.last = None # Last level added
+        self.last_x = 0.0 # Days from origin to the last reading
+        self.span = 0.0 # Days covered
+        self.n = 0
+        self.sx = 0.0
+        self.sy = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+
+    def add(self, timestamp, level):
+        if self.last is not None and level >= self.last + RESET_JUMP:
+            self.reset() # Charged or replaced, the old discharge doesn't apply anymore
+        if self.origin is None:
+            self.origin = timestamp
+        x = (timestamp - self.origin) / DAY
+        self.last = level
+        self.last_x = x
+        self.span = max(self.span, x)
+        self.n += 1
+        self.sx += x
+        self.sy += level
+        self.sxx += x * x
+        self.sxy += x * level
+
+    def slope(self):
+        # Level change per day, None until there is enough data
+        if self.n < 2 or self.span * DAY < MIN_SPAN:
+            return None
+        denominator = self.n * self.sxx - self.sx * self.sx
+        if denominator <= 0:
+            return None
+        return (self.n * self.sxy - self.sx * self.sy) / denominator
+
+    def days_until_empty(self):
+        slope = self.slope()
+        if slope is None or slope >= 0 or self.last is None:
+            return None # Not discharging (or not known yet)
+        intercept = (self.sy - slope * self.sx) / self.n
+        level = max(intercept + slope * self.last_x, 0.0) # Fitted level at the last reading
+        return level / -slope
@@ -0,0 +1,89 @@
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/deadline_timer.py
+#
+# Deadline timer
+#
+# Replacement for the cancel_timer + run_in pattern used to push back an off timer on every motion event.
+# restart() only moves the deadline in memory. The single AppDaemon timer underneath is left alone, and
+# when it fires before the deadline it re-arms itself for the remaining time. A busy sensor then costs
+# one scheduler operation per off cycle (plus one per re-arm) instead of two per event.
+#
+# The timer is only rescheduled right away if the new deadline is earlier than the pending timer.
+#
+# Usage:
+#   import deadline_timer
+#
+#   self.timer = deadline_timer.DeadlineTimer(self, self.timer_callback)
+#   self.timer.restart(300)     # Turn off in 5 minutes from now
+#   self.timer.active           # True while the deadline is pending
+#   self.timer.cancel()
+#   self.timer.restore(deadline) # Re-arm a deadline saved before a reload (see app_state.py)
+#
+# The callback receives the same kwargs dict a run_in callback would.
+#
+# This module is not an app, it does not need an entry in apps.yaml.
+
+# Timers this close to the deadline are treated as on time instead of re-arming for a fraction of a second
+TOLERANCE = 1
+
+
+class DeadlineTimer:
+    def __init__(self, app, callback):
+        self.app = app
+        self.callback = callback
+        self.handle = None # Underlying AppDaemon timer
+        self.fires_at = None # Time the underlying timer is scheduled for
+        self.deadline = None # Time the callback should run, None when not active
+
+    @property
+    def active(self):
+        return self.deadline is not None
+
+    def remaining(self):
+        # Seconds left until the deadline, None when not active
+        if self.deadline is None:
+            return None
+        return max(self.deadline - self.app.get_now_ts(), 0)
+
+    def restart(self, delay):
+        self.restart_at(self.app.get_now_ts() + delay)
+
+    def restart_at(self, deadline):
+        self.deadline = deadline
+        if self.handle is None:
+            self.schedule(deadline)
+        elif self.fires_at > deadline + TOLERANCE:
+            # New deadline is earlier than the pending timer, has to be rescheduled
+            self.app.cancel_timer(self.handle)
+            self.schedule(deadline)
+
+    def restore(self, deadline):
+        # Re-arms a saved absolute deadline for the time that is left, one that already passed fires right away
+        self.restart_at(max(deadline, self.app.get_now_ts()))
+
+    def cancel(self):
+        self.deadline = None
+        if self.handle is not None:
+            self.app.cancel_timer(self.handle)
+            self.handle = None
+            self.fires_at = None
+
+    def schedule(self, when):
+        self.fires_at = when
+        self.handle = self.app.run_in(self.timer_callback, max(when - self.app.get_now_ts(), 0))
+
+    def timer_callback(self, kwargs):
+        self.handle = None
+        self.fires_at = None
+        if self.deadline is None:
+            return
+
+        if self.deadline - self.app.get_now_ts() > TOLERANCE:
+            # Deadline was pushed back since this timer was scheduled, wait for the rest
+            self.schedule(self.deadline)
+            return
+
+        self.deadline = None
+        self.callback(kwargs)
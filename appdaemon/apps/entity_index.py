@@ -0,0 +1,271 @@
+import bisect
+import collections
+import threading
+
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/entity_index.py
+#
+# Shared entity index
+#
+# Keeps one copy of the Home Assistant state dump per AppDaemon process so that apps don't each pull
+# the full dump with get_state() and scan it. The index is built from a single snapshot the first
+# time an app attaches, and kept current from state_changed events.
+#
+# The first attached app owns the state_changed subscription. If it terminates, the next attached
+# app takes over, and when the last app detaches the index is dropped and rebuilt on the next attach.
+# The subscription is registered with the app's own listen_event, past the recorder/instrumentation/async
+# wrappers, so it is never recorded or counted as one of the app's callbacks.
+#
+# Lookups:
+#   get(entity_id)              -> state dict (same layout as get_state()) or None
+#   by_device_class(name)       -> sorted list of entity ids
+#   by_domain(name)             -> sorted list of entity ids
+#   with_prefix(prefix)         -> sorted list of entity ids starting with prefix
+#   add_listener(app, callback, match=None)
+#                               -> callback(entity_id, old_state, new_state) on every change (match(...) is True for)
+#
+# Listeners run on their own app's thread, like its other callbacks. Changes are queued per listener and
+# delivered from a run_in(0) on the listening app, a listener of the owner app is called right away. So a
+# listener may touch its app's state without locking against the other apps, but it runs a little after the
+# index has changed. match is called on the owner's thread for every change, it must only look at its
+# arguments (and attributes that never change after initialize).
+#
+# The index itself is updated on the owner's thread, so it is as current as the owner's callback queue. An
+# app that blocks its thread for a long time delays the index for everyone.
+#
+# Usage:
+#   import entity_index
+#
+#   def initialize(self):
+#       self.index = entity_index.attach(self)
+#
+#   def terminate(self):
+#       entity_index.detach(self)
+#
+# This module is not an app, it does not need an entry in apps.yaml.
+
+class EntityIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.states = {} # entity_id -> state dict
+        self.device_classes = {} # device_class -> set of entity ids
+        self.domains = {} # domain -> set of entity ids
+        self.sorted_ids = [] # All entity ids, sorted for prefix lookups
+        self.listeners = [] # Listener
+        self.apps = [] # Attached apps, the first one owns the subscription
+        self.handle = None # state_changed listen handle of the owner
+        self.loaded = False
+
+    #
+    # Lifecycle
+    #
+
+    def attach(self, app):
+        with self.lock:
+            if app in self.apps:
+                return self
+            self.apps.append(app)
+            if not self.loaded:
+                self.load(app.get_state()) # The only full dump
+            if self.handle is None:
+                self.handle = unwrapped(app, "listen_event")(self.state_changed, "state_changed")
+        return self
+
+    def detach(self, app):
+        with self.lock:
+            for listener in self.listeners:
+                if listener.app is app:
+                    listener.active = False
+            self.listeners = [l for l in self.listeners if l.app is not app]
+            if not app in self.apps:
+                return
+            owner = self.apps[0] is app
+            self.apps.remove(app)
+
+            if not owner:
+                return
+
+            if self.apps:
+                # Subscribe the new owner before dropping the old subscription so no event is missed
+                old_handle = self.handle
+                self.handle = unwrapped(self.apps[0], "listen_event")(self.state_changed, "state_changed")
+                try:
+                    unwrapped(app, "cancel_listen_event")(old_handle)
+                except Exception:
+                    pass # AppDaemon cleans up listeners of terminated apps anyway
+            else:
+                try:
+                    unwrapped(app, "cancel_listen_event")(self.handle)
+                except Exception:
+                    pass
+                self.handle = None
+                self.clear()
+
+    def load(self, hastate):
+        self.clear()
+        for entity, state in hastate.items():
+            self.add(entity, state)
+        self.sorted_ids = sorted(self.states)
+        self.loaded = True
+
+    def clear(self):
+        self.states = {}
+        self.device_classes = {}
+        self.domains = {}
+        self.sorted_ids = []
+        self.loaded = False
+
+    #
+    # Event handling
+    #
+
+    def state_changed(self, event_name, data, kwargs):
+        entity = data.get("entity_id")
+        if entity is None:
+            return
+        new_state = data.get("new_state")
+
+        with self.lock:
+            old_state = self.states.get(entity)
+            if old_state is not None:
+                self.remove(entity, old_state)
+            if new_state is not None:
+                self.add(entity, new_state)
+                if old_state is None:
+                    bisect.insort(self.sorted_ids, entity)
+            elif old_state is not None:
+                i = bisect.bisect_left(self.sorted_ids, entity)
+                if i < len(self.sorted_ids) and self.sorted_ids[i] == entity:
+                    del self.sorted_ids[i]
+            listeners = list(self.listeners)
+            owner = self.apps[0] if self.apps else None
+
+        for listener in listeners:
+            if listener.match is None or listener.match(entity, old_state, new_state):
+                listener.notify((entity, old_state, new_state), listener.app is owner)
+
+    def add(self, entity, state):
+        self.states[entity] = state
+        self.domains.setdefault(entity.split(".", 1)[0], set()).add(entity)
+        device_class = device_class_of(state)
+        if device_class is not None:
+            self.device_classes.setdefault(device_class, set()).add(entity)
+
+    def remove(self, entity, state):
+        del self.states[entity]
+        self.domains.get(entity.split(".", 1)[0], set()).discard(entity)
+        device_class = device_class_of(state)
+        if device_class is not None:
+            self.device_classes.get(device_class, set()).discard(entity)
+
+    def add_listener(self, app, callback, match=None):
+        with self.lock:
+            self.listeners.append(Listener(app, callback, match))
+
+    def remove_listener(self, app, callback):
+        with self.lock:
+            for listener in self.listeners:
+                if listener.app is app and listener.callback == callback:
+                    listener.active = False
+            self.listeners = [l for l in self.listeners if l.active]
+
+    #
+    # Lookups
+    #
+
+    def get(self, entity):
+        with self.lock:
+            return self.states.get(entity)
+
+    def get_state(self, entity, attribute=None, default=None):
+        # Same shape as hass.get_state(entity) / get_state(entity, attribute=...)
+        state = self.get(entity)
+        if state is None:
+            return default
+        if attribute is None:
+            return state.get("state", default)
+        return state.get("attributes", {}).get(attribute, default)
+
+    def by_device_class(self, device_class):
+        with self.lock:
+            return sorted(self.device_classes.get(device_class, ()))
+
+    def by_domain(self, domain):
+        with self.lock:
+            return sorted(self.domains.get(domain, ()))
+
+    def with_prefix(self, prefix):
+        with self.lock:
+            i = bisect.bisect_left(self.sorted_ids, prefix)
+            result = []
+            while i < len(self.sorted_ids) and self.sorted_ids[i].startswith(prefix):
+                result.append(self.sorted_ids[i])
+                i += 1
+            return result
+
+    def __contains__(self, entity):
+        with self.lock:
+            return entity in self.states
+
+    def __len__(self):
+        with self.lock:
+            return len(self.states)
+
+
+class Listener:
+    # An add_listener callback, see the header for which thread it runs on
+    def __init__(self, app, callback, match):
+        self.app = app
+        self.callback = callback
+        self.match = match
+        self.lock = threading.Lock()
+        self.pending = collections.deque() # Changes waiting for deliver
+        self.scheduled = False # A deliver is waiting to run
+        self.active = True
+
+    def notify(self, change, on_app_thread):
+        with self.lock:
+            inline = on_app_thread and not self.pending # Queued changes go first
+            if not inline:
+                self.pending.append(change)
+                if self.scheduled:
+                    return
+                self.scheduled = True
+        if inline:
+            self.callback(*change)
+        else:
+            unwrapped(self.app, "run_in")(self.deliver, 0)
+
+    def deliver(self, kwargs):
+        # Runs on the listening app's thread
+        with self.lock:
+            changes = list(self.pending)
+            self.pending.clear()
+            self.scheduled = False
+        for change in changes:
+            if not self.active:
+                return
+            self.callback(*change)
+
+
+def unwrapped(app, name):
+    # The hassapi method itself, skipping wrappers the mixins put on the instance (recorder.py, async_actions.py...)
+    return getattr(type(app), name).__get__(app, type(app))
+
+
+def device_class_of(state):
+    try:
+        return state["attributes"]["device_class"]
+    except (KeyError, TypeError):
+        return None
+
+
+_index = EntityIndex()
+
+def attach(app):
+    return _index.attach(app)
+
+def detach(app):
+    _index.detach(app)
@@ -0,0 +1,99 @@
+import collections
+import threading
+from datetime import datetime
+
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/ha_log.py
+#
+# Buffered log sink for sensor.adlog
+#
+# Replacement for writing every log line straight to sensor.adlog with set_state. log() only adds the
+# line to a ring buffer and returns, the buffer is written to HA later from a scheduler callback, so
+# the callback doing the logging never waits on HA and the recorder gets one state write per batch
+# instead of one per line.
+#
+# A batch is written `interval` seconds after the first buffered line, or right away (from a run_in 0
+# callback) once `batch` lines are waiting. The state is the newest line (HA cuts states at 255
+# characters), the batch is in the "lines" attribute.
+#
+# If HA falls behind and the buffer fills up (`capacity` lines), the oldest lines are dropped and
+# counted, the count is added to the next write. The same message logged again right after itself is
+# folded into one line with a (xN) count instead of taking more space.
+#
+# Usage:
+#   import ha_log
+#
+#   self.ha_log = ha_log.LogSink(self) # entity, interval, batch and capacity are optional
+#   self.ha_log.log("Turning off fan")
+#   self.ha_log.flush() # In terminate, so buffered lines aren't lost
+#
+# This module is not an app, it does not need an entry in apps.yaml.
+
+class LogSink:
+    def __init__(self, app, entity="sensor.adlog", interval=5, batch=20, capacity=100):
+        self.app = app
+        self.entity = entity
+        self.interval = interval
+        self.batch = batch
+        self.lock = threading.Lock()
+        self.buffer = collections.deque(maxlen=capacity) # [time, message, repeats]
+        self.handle = None # Scheduled write, None when nothing is buffered
+        self.soon = False # True when the scheduled write is the immediate (full batch) one
+        self.dropped = 0 # Lines dropped since the last write
+        self.writes = 0 # set_state calls made
+        self.attributes = {"source": "AppDaemon", "icon": "mdi:google-cardboard", "friendly_name": "AppDaemon Log"}
+
+    def log(self, message):
+        now = self.app.get_now_ts()
+        with self.lock:
+            if self.buffer and self.buffer[-1][1] == message:
+                last = self.buffer[-1]
+                last[0] = now
+                last[2] += 1
+                return
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1 # deque drops the oldest line
+            self.buffer.append([now, message, 1])
+
+            if len(self.buffer) >= self.batch and not self.soon:
+                if self.handle is not None:
+                    self.app.cancel_timer(self.handle)
+                self.soon = True
+                self.handle = self.app.run_in(self.flush_callback, 0)
+            elif self.handle is None:
+                self.handle = self.app.run_in(self.flush_callback, self.interval)
+
+    def flush_callback(self, kwargs):
+        self.flush(timer_fired=True)
+
+    def flush(self, timer_fired=False):
+        with self.lock:
+            entries = list(self.buffer)
+            self.buffer.clear()
+            dropped = self.dropped
+            self.dropped = 0
+            handle = self.handle
+            self.handle = None
+            self.soon = False
+
+        if handle is not None and not timer_fired:
+            self.app.cancel_timer(handle)
+        if not entries:
+            return
+
+        lines = [format_line(self.app.name, *entry) for entry in entries]
+        attributes = dict(self.attributes)
+        attributes["lines"] = lines
+        if dropped:
+            attributes["dropped"] = dropped
+        self.writes += 1
+        self.app.set_state(self.entity, state=lines[-1][:255], attributes=attributes)
+
+
+def format_line(name, ts, message, repeats):
+    line = "[{0}] {1}  ({2})".format(name, message, datetime.fromtimestamp(ts).strftime("%H:%M:%S"))
+    if repeats > 1:
+        line += " (x{0})".format(repeats)
+    return line
@@ -0,0 +1,209 @@
+import hassapi as hass
+import instrumentation
+import recorder
+import bathroom_control
+import datetime
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # Falls back to plain Python, same results, just slower with many rooms
+
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/humidity_engine.py
+#
+# Humidity trend engine for many bathrooms
+#
+# Runs the humidity trend detection of bathroom_control.py for every bathroom in one app. All sensors
+# are sampled into one ring buffer (sensors x samples) every `interval` seconds, and the rolling mean,
+# slope and threshold check of every room are done in one pass with NumPy. Rooms whose humidity just
+# crossed the threshold get a bathroom_control.ENGINE_EVENT event for their bathroom_fan_control app, which
+# runs hum_trigger() on that app's own thread. The rest are left alone.
+# Without NumPy installed the same calculation runs in plain Python.
+#
+# The bathroom apps are configured without the humidity arg, so they don't run their own trend sensor.
+#
+# --------------------------------------------
+# Args:
+#
+#   Required:
+#     rooms: Map of bathroom_fan_control app name -> humidity sensor entity
+#
+#   Optional:
+#     interval: Seconds between samples. Defaults to 15
+#     humidity_window: Length in seconds of the window the humidity is averaged over. Defaults to 900 seconds (15 Minutes)
+#     humidity_threshold: How far above the average the humidity has to rise to trigger the fan. Defaults to 5
+#     slope_threshold: Also trigger when the humidity rises faster than this many % per minute over the window. Off by default
+#
+# Example:
+#   bathroom_humidity:
+#     module: humidity_engine
+#     class: HumidityEngine
+#     rooms:
+#       main_bathroom_fan: sensor.main_bathroom_humidity
+#       upstairs_bathroom_fan: sensor.upstairs_bathroom_humidity
+
+class HumidityEngine(recorder.Recorder, instrumentation.Instrumentation, hass.Hass):
+    def initialize(self):
+        # Opt-in callback timing (see instrumentation.py), has to run before any callback is registered
+        self.setup_instrumentation("humidity_callback", "sample_callback")
+        self.setup_recorder() # Opt-in callback and action recording (see recorder.py)
+
+        if not "rooms" in self.args:
+            self.log("Error loading, required argument 'rooms' not defined")
+            return
+
+        if "interval" in self.args:
+            self.interval = int(self.args["interval"])
+        else:
+            self.interval = 15
+
+        if "humidity_window" in self.args:
+            window = int(self.args["humidity_window"])
+        else:
+            window = 900 # 15 Minutes
+
+        if "humidity_threshold" in self.args:
+            self.humidity_threshold = float(self.args["humidity_threshold"])
+        else:
+            self.humidity_threshold = 5
+
+        if "slope_threshold" in self.args:
+            self.slope_threshold = float(self.args["slope_threshold"])
+        else:
+            self.slope_threshold = None
+
+        self.rooms = list(self.args["rooms"]) # Row number -> bathroom app name
+        self.sensors = [self.args["rooms"][room] for room in self.rooms]
+        self.rows = {} # Sensor -> row numbers (one sensor can serve several rooms)
+        for row, sensor in enumerate(self.sensors):
+            self.rows.setdefault(sensor, []).append(row)
+
+        self.buffer = RingBuffer(len(self.rooms), max(window // self.interval, 2))
+        self.current = [None] * len(self.rooms) # Latest reading per row, None while unavailable
+        self.triggered = [False] * len(self.rooms) # Rows above the threshold at the last sample
+
+        for sensor, rows in self.rows.items():
+            reading = bathroom_control.parse_reading(self.get_state(sensor))
+            for row in rows:
+                self.current[row] = reading
+                if reading is not None:
+                    # Fill the window with the current humidity so the average starts out flat
+                    self.buffer.fill(row, reading)
+            self.listen_state(self.humidity_callback, sensor)
+
+        start = self.datetime() + datetime.timedelta(seconds=self.interval)
+        self.run_every(self.sample_callback, start, self.interval)
+        self.log("Tracking humidity for {0} rooms ({1})".format(len(self.rooms), "numpy" if np is not None else "python"))
+
+    def terminate(self):
+        self.stop_recorder()
+
+    def humidity_callback(self, entity, attribute, old, new, kwargs):
+        reading = bathroom_control.parse_reading(new) # None while the sensor is unavailable
+        for row in self.rows[entity]:
+            self.current[row] = reading
+
+    def sample_callback(self, kwargs):
+        # Compare every room against its average before this sample, then add the sample to the window
+        means, slopes = self.buffer.stats()
+        sample = self.current[:]
+        crossed = []
+        for row, reading in enumerate(sample):
+            above = False
+            if reading is not None and means[row] is not None:
+                if reading - means[row] > self.humidity_threshold:
+                    above = True
+                elif self.slope_threshold is not None and slopes[row] * 60 / self.interval > self.slope_threshold:
+                    above = True
+            if above and not self.triggered[row]:
+                crossed.append(row)
+            self.triggered[row] = above
+        self.buffer.push(sample)
+
+        for row in crossed:
+            app = self.get_app(self.rooms[row])
+            if app is None:
+                self.log("Bathroom app {0} isn't running, can't trigger its fan".format(self.rooms[row]))
+                continue
+            self.log("Humidity rising in {0}, triggering fan".format(self.rooms[row]))
+            self.fire_event(bathroom_control.ENGINE_EVENT, app=self.rooms[row]) # Handled on the bathroom app's thread
+
+
+class RingBuffer:
+    # rows x samples ring buffer of readings. Missing readings (sensor unavailable) are NaN and left out
+    # of the statistics instead of being counted as zero.
+
+    def __init__(self, rows, samples):
+        self.rows = rows
+        self.samples = samples
+        self.pos = 0 # Column the next sample goes in, which is also the oldest column
+        if np is not None:
+            self.data = np.full((rows, samples), np.nan)
+        else:
+            self.data = [[math.nan] * samples for row in range(rows)]
+
+    def fill(self, row, value):
+        for column in range(self.samples):
+            self.data[row][column] = value
+
+    def push(self, values):
+        if np is not None:
+            self.data[:, self.pos] = [math.nan if value is None else value for value in values]
+            self.pos = (self.pos + 1) % self.samples
+            return
+        for row, value in enumerate(values):
+            self.data[row][self.pos] = math.nan if value is None else value
+        self.pos = (self.pos + 1) % self.samples
+
+    def ages(self):
+        # Position of every column in time, 0 for the oldest sample
+        return [(column - self.pos) % self.samples for column in range(self.samples)]
+
+    def stats(self):
+        # Returns (means, slopes) per row. The slope is per sample, least squares over the window.
+        # Rows without readings get a mean of None.
+        if np is None:
+            return self.stats_python()
+
+        x = np.array(self.ages(), dtype=float)
+        valid = ~np.isnan(self.data)
+        y = np.where(valid, self.data, 0.0)
+        n = valid.sum(axis=1)
+        sx = (valid * x).sum(axis=1)
+        sy = y.sum(axis=1)
+        sxx = (valid * x * x).sum(axis=1)
+        sxy = (y * x).sum(axis=1)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = sy / n
+            denominator = n * sxx - sx * sx
+            slopes = np.where(denominator > 0, (n * sxy - sx * sy) / denominator, 0.0)
+
+        means = [None if count == 0 else float(mean) for count, mean in zip(n, means)]
+        return means, [float(slope) for slope in slopes]
+
+    def stats_python(self):
+        x = self.ages()
+        means = []
+        slopes = []
+        for row in self.data:
+            n = sx = sy = sxx = sxy = 0.0
+            for age, value in zip(x, row):
+                if value == value: # Not NaN
+                    n += 1
+                    sx += age
+                    sy += value
+                    sxx += age * age
+                    sxy += age * value
+            if n == 0:
+                means.append(None)
+                slopes.append(0.0)
+                continue
+            means.append(sy / n)
+            denominator = n * sxx - sx * sx
+            slopes.append((n * sxy - sx * sy) / denominator if denominator > 0 else 0.0)
+        return means, slopes
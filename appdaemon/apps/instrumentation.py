@@ -0,0 +1,183 @@
+import asyncio
+import datetime
+import functools
+import math
+import threading
+import time
+
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/instrumentation.py
+#
+# Callback instrumentation
+#
+# Mixin for the apps that times their callbacks and counts the calls they make to HA, so when AppDaemon
+# complains about a slow callback it is possible to tell which app (and which callback) it was.
+#
+# It is off unless the app has the "instrument" arg. When off nothing is wrapped, so it costs nothing.
+# When on, every listed callback is wrapped with a timer that feeds a fixed size latency histogram
+# (p50/p95/p99), and get_state, set_state and the service calls are counted. A summary is published
+# every instrument_interval seconds (default 300) to sensor.ad_perf_<app name>, the same way halog
+# publishes sensor.adlog. Nothing is published if no callback ran since the last summary.
+#
+# Args (on the app using the mixin):
+#   instrument: Enable instrumentation
+#   instrument_interval: Seconds between summaries. Defaults to 300
+#
+# Usage:
+#   import instrumentation
+#
+#   class MyApp(instrumentation.Instrumentation, hass.Hass):
+#       def initialize(self):
+#           # First thing in initialize, before any callback is registered
+#           self.setup_instrumentation("motion_callback", "timer_callback")
+#
+#   Callbacks that don't live on the app (helper objects) can be wrapped with self.instrument(name, function)
+#   Helpers with their own counters add them to the summary with self.instrument_stats(name, function),
+#   function() returns a dict that is published as the name attribute
+#
+# This module is not an app, it does not need an entry in apps.yaml.
+
+# Histogram buckets: 4 per doubling, starting at 1 microsecond, up to about 4.5 minutes
+BUCKETS_PER_DOUBLING = 4
+BUCKETS = BUCKETS_PER_DOUBLING * 28
+
+READ_CALLS = ("get_state",)
+WRITE_CALLS = ("set_state",)
+SERVICE_CALLS = ("call_service", "turn_on", "turn_off", "toggle", "notify")
+
+
+class LatencyHistogram:
+    # Log scale histogram, fixed memory no matter how many samples. Percentiles are accurate to about 19%
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = seconds * 1000000
+        if us < 1:
+            bucket = 0
+        else:
+            bucket = min(int(math.log2(us) * BUCKETS_PER_DOUBLING), BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        # Returns the upper edge of the bucket holding the p-th percentile, in seconds
+        if self.count == 0:
+            return 0.0
+        target = p * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(2 ** ((bucket + 1) / BUCKETS_PER_DOUBLING) / 1000000, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0,
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class Instrumentation:
+    def setup_instrumentation(self, *callbacks):
+        self.perf_enabled = "instrument" in self.args
+        if not self.perf_enabled:
+            return
+
+        self.perf_lock = threading.Lock()
+        self.perf_callbacks = {} # callback name -> LatencyHistogram
+        self.perf_counts = {"reads": 0, "writes": 0, "services": 0}
+        self.perf_publish = self.set_state # Unwrapped, publishing isn't counted
+        self.perf_published = None # Callback total at the last summary
+        self.perf_stats = {} # name -> function returning a dict, see instrument_stats
+
+        for name in callbacks:
+            setattr(self, name, self.instrument(name, getattr(self, name)))
+        for name in READ_CALLS:
+            setattr(self, name, self.count_calls("reads", getattr(self, name)))
+        for name in WRITE_CALLS:
+            setattr(self, name, self.count_calls("writes", getattr(self, name)))
+        for name in SERVICE_CALLS:
+            setattr(self, name, self.count_calls("services", getattr(self, name)))
+
+        interval = int(self.args.get("instrument_interval", 300))
+        start = self.datetime() + datetime.timedelta(seconds=interval)
+        self.run_every(self.publish_instrumentation, start, interval)
+
+    def instrument(self, name, function):
+        # Returns function wrapped with a timer, or function itself when instrumentation is off
+        if not getattr(self, "perf_enabled", False):
+            return function
+
+        histogram = self.perf_callbacks.setdefault(name, LatencyHistogram())
+        lock = self.perf_lock
+        clock = time.perf_counter
+
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def timed(*args, **kwargs):
+                start = clock()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    elapsed = clock() - start
+                    with lock:
+                        histogram.add(elapsed)
+        else:
+            @functools.wraps(function)
+            def timed(*args, **kwargs):
+                start = clock()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    elapsed = clock() - start
+                    with lock:
+                        histogram.add(elapsed)
+        return timed
+
+    def instrument_stats(self, name, function):
+        # Publishes function() as the name attribute of every summary, nothing happens when instrumentation is off
+        if getattr(self, "perf_enabled", False):
+            self.perf_stats[name] = function
+
+    def count_calls(self, key, function):
+        counts = self.perf_counts
+
+        @functools.wraps(function)
+        def counted(*args, **kwargs):
+            counts[key] += 1
+            return function(*args, **kwargs)
+        return counted
+
+    def instrumentation_summary(self):
+        with self.perf_lock:
+            callbacks = {name: h.summary() for name, h in self.perf_callbacks.items()}
+            counts = dict(self.perf_counts)
+        total = sum(c["count"] for c in callbacks.values())
+        return total, callbacks, counts
+
+    def publish_instrumentation(self, kwargs):
+        total, callbacks, counts = self.instrumentation_summary()
+        if total == self.perf_published:
+            return # Nothing new
+        self.perf_published = total
+        attributes = {"source": "AppDaemon", "icon": "mdi:timer-outline", "friendly_name": "AppDaemon Perf " + self.name,
+                      "callbacks": callbacks}
+        attributes.update(counts)
+        for name, stats in self.perf_stats.items():
+            attributes[name] = stats()
+        entity = "sensor.ad_perf_" + "".join(c if c.isalnum() else "_" for c in self.name.lower())
+        self.perf_publish(entity, state=total, attributes=attributes)
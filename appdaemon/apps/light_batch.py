@@ -0,0 +1,105 @@
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/light_batch.py
+#
+# Batched light service calls
+#
+# turn_on/turn_off take one entity or a list of entities and send one service call per domain with
+# the whole entity list, instead of one call per light. That is one websocket round trip, and the
+# lights change together instead of popping on one after another. Only the domains in SERVICE_DOMAINS
+# have their own turn_on/turn_off services, everything else (groups, scenes, scripts...) is sent together
+# as homeassistant/turn_on or homeassistant/turn_off, the same as AppDaemon's turn_on does.
+#
+# Calls that wouldn't change anything are skipped, based on the last known state in the shared entity
+# index (see entity_index.py):
+#   turn_off - entity is already off
+#   turn_on  - entity is already on, and at the requested brightness if one is given (within 2)
+# Scenes, scripts and other domains that don't have an on/off state are never skipped.
+# The index is updated after the fact, so an entity isn't skipped until the index shows the result of the
+# last call sent for it (a turn_on right after a turn_off is always sent).
+#
+# Usage:
+#   import light_batch
+#
+#   self.lights = light_batch.LightBatch(self, self.index)
+#   self.lights.turn_on(["light.a", "light.b"], brightness=255)
+#   self.lights.turn_off(self.all_light_entities)
+#
+# This module is not an app, it does not need an entry in apps.yaml.
+
+# Domains where the state can be compared with the request
+STATEFUL_DOMAINS = ("light", "switch", "fan", "input_boolean")
+# Domains with their own turn_on/turn_off services
+SERVICE_DOMAINS = ("light", "switch", "fan", "input_boolean")
+
+
+class LightBatch:
+    def __init__(self, app, index):
+        self.app = app
+        self.index = index
+        self.calls = 0 # Service calls sent
+        self.skipped = 0 # Entities left alone because they already matched
+        self.pending = {} # entity -> (action, brightness) of the last call sent that the index hasn't shown yet
+
+    def turn_on(self, entities, **kwargs):
+        self.send("turn_on", entities, kwargs)
+
+    def turn_off(self, entities, **kwargs):
+        self.send("turn_off", entities, kwargs)
+
+    def send(self, action, entities, kwargs):
+        if isinstance(entities, str):
+            entities = [entities]
+
+        # Only requests with at most a brightness can be compared with the current state
+        comparable = not [k for k in kwargs if k != "brightness"]
+
+        # Group what is left by service domain, keeping the order
+        groups = {}
+        for entity in entities:
+            if comparable and self.matches(entity, action, kwargs.get("brightness")):
+                self.skipped += 1
+                continue
+            domain = entity.split(".", 1)[0]
+            if domain in STATEFUL_DOMAINS:
+                self.pending[entity] = (action, kwargs.get("brightness") if comparable else None)
+            if not domain in SERVICE_DOMAINS:
+                domain = "homeassistant"
+            groups.setdefault(domain, []).append(entity)
+
+        for domain, group in groups.items():
+            if len(group) == 1:
+                group = group[0]
+            self.calls += 1
+            self.app.call_service("{0}/{1}".format(domain, action), entity_id=group, **kwargs)
+
+    def matches(self, entity, action, brightness):
+        # Returns True if the entity is already in the requested state
+        if not entity.split(".", 1)[0] in STATEFUL_DOMAINS:
+            return False
+
+        state = self.index.get(entity)
+        if state is None:
+            return False
+
+        if entity in self.pending:
+            if not in_state(state, *self.pending[entity]):
+                return False # The index hasn't caught up with the last call sent, its state is stale
+            del self.pending[entity]
+        return in_state(state, action, brightness)
+
+
+def in_state(state, action, brightness):
+    # True if state is what action (and brightness, within 2) results in
+    if action == "turn_off":
+        return state.get("state") == "off"
+
+    if state.get("state") != "on":
+        return False
+    if brightness is None:
+        return True
+    current = state.get("attributes", {}).get("brightness")
+    if current is None:
+        return False
+    return abs(current - brightness) <= 2
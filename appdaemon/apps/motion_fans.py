@@ -1,6 +1,12 @@
 import hassapi as hass
+import instrumentation
+import recorder
+import bisect
+import deadline_timer
+import state_cache
+import app_state
 
-__version__ = "2022-06-29"
+__version__ = "2026-10-18"
 
 # Motion Fans
 # App to Automatically control fans based on motion or other activity
@@ -21,15 +27,37 @@ __version__ = "2022-06-29"
 # Optional:
 # 
 # speedmap: Speedmap, defaults to 1
+# speed_curve: Custom speed curve instead of a speedmap, list of [temperature, percentage] breakpoints.
+#   The fan runs at the percentage of the highest breakpoint the temperature is above, and off below the first one.
+#   speed_curve:
+#     - [65, 33]
+#     - [72, 67]
+#     - [75, 100]
+# hysteresis: Degrees the temperature has to go past a breakpoint before the speed changes. Defaults to 0.5
 # delay: amount of time in seconds after turning on to turn off again. If not specified defaults to 2700 seconds 
 # condition: Entity that needs to be on for automations to run
 #
 # If the condition shuts off while the fan is already on, it will wait the normal delay before turning off
+# While the fan is on, its speed follows the temperature (one speed change each time it crosses a breakpoint)
+# The off deadline and speed band are kept across reloads and restarts (see app_state.py)
 
-class MotionFan(hass.Hass):
+# Built in speed curves for the speedmap arg, (temperature, percentage) breakpoints
+SPEED_MAPS = {
+    1: [(65, 33), (72, 67), (75, 100)], # Aggressive cooling
+    2: [(65, 33), (72, 67), (79, 100)], # Slightly less aggressive cooling
+}
+
+class MotionFan(app_state.SavedState, recorder.Recorder, instrumentation.Instrumentation, hass.Hass):
     def initialize(self):
-        # Create a variable to store the timer handle
-        self.timer_handle = None 
+        # Opt-in callback timing (see instrumentation.py), has to run before any callback is registered
+        self.setup_instrumentation("motion_callback", "condition_callback", "temperature_callback", "timer_callback")
+        self.setup_recorder() # Opt-in callback and action recording (see recorder.py)
+
+        # Off timer, motion only pushes back its deadline (see deadline_timer.py)
+        self.timer_handle = deadline_timer.DeadlineTimer(self, self.timer_callback)
+
+        # Condition and temperature states are cached and kept current by their callbacks (see state_cache.py)
+        self.states = state_cache.StateCache(self)
 
         # Check for delay, and set default if needed
         if "delay" in self.args:
@@ -42,16 +70,34 @@ class MotionFan(hass.Hass):
         else:
             self.error("No fan specfied")
 
+        if "speedmap" in self.args:
+            self.speedmode = self.args["speedmap"]
+        else:
+            self.speedmode = 1 #Default to 1
+
+        if "hysteresis" in self.args:
+            hysteresis = float(self.args["hysteresis"])
+        else:
+            hysteresis = 0.5
+
+        if "speed_curve" in self.args:
+            self.curve = SpeedCurve(self.args["speed_curve"], hysteresis)
+        elif str(self.speedmode).isdigit() and int(self.speedmode) in SPEED_MAPS:
+            self.speedmode = int(self.speedmode)
+            self.curve = SpeedCurve(SPEED_MAPS[self.speedmode], hysteresis)
+        else:
+            self.log("Error loading, speedmap {0} doesn't exist, use one of {1} or a speed_curve".format(self.speedmode, ", ".join(str(m) for m in SPEED_MAPS)))
+            return
+        self.band = None # Speed band the fan was last set to, None while the app hasn't turned it on
+
+        # Temperature is held from its state changes instead of read on every motion event
         if "temperature" in self.args:
             self.temperature_entity = self.args["temperature"]
+            self.states.track(self.temperature_entity)
+            self.listen_state(self.temperature_callback, self.temperature_entity)
         else:
             self.error("No temperature sensor specfied")
 
-        if "speedmap" in self.args:
-            self.speedmode = int(self.args["speedmap"])
-        else:
-            self.speedmode = 1 #Default to 1
-
         # Check if sensor entity or sensor entity list is defined
         if "sensor" in self.args:
             sensor = self.args["sensor"]
@@ -69,22 +115,33 @@ class MotionFan(hass.Hass):
         # Check for condition entity, subscribe and set variable
         if "condition" in self.args:
             self.condition_entity = self.args["condition"]
+            self.states.track(self.condition_entity)
             self.listen_state(self.condition_callback, self.condition_entity)
         else:
             self.condition_entity = False
         
-        # Clean up current state
+        # Clean up current state, keeping the off deadline from before a reload
+        saved = self.load_saved_state()
         if self.get_allowed() and self.get_state(self.fan_entity) == "on":
-            self.log("Restarted timer because the fan is on during controller startup")
-            self.restart_timer()
+            if saved.get("deadline") is not None:
+                band = saved.get("band")
+                if isinstance(band, int) and 0 <= band < self.curve.bands(): # The speed curve may have changed
+                    self.band = band
+                self.timer_handle.restore(saved["deadline"])
+                self.log("Restored timer because the fan is on during controller startup, {0:.0f} seconds left".format(self.timer_handle.remaining()))
+            else:
+                self.log("Restarted timer because the fan is on during controller startup")
+                self.restart_timer()
 
     def terminate(self):
-        if self.timer_handle != None:
-            self.cancel_timer(self.timer_handle)
+        if hasattr(self, "band"): # Not set if initialize stopped on a bad speedmap
+            self.save_state({"deadline": self.timer_handle.deadline, "band": self.band})
+        self.timer_handle.cancel()
+        self.stop_recorder()
 
     def motion_callback(self, entity, attribute, old, new, kwargs):
         if self.condition_entity:
-            automation_allowed = self.get_state(self.condition_entity)
+            automation_allowed = self.states.get(self.condition_entity)
         else:
             automation_allowed = "on"
 
@@ -93,16 +150,28 @@ class MotionFan(hass.Hass):
             self.fan_on()
 
     def condition_callback(self, entity, attribute, old, new, kwargs):
+        self.states.update(entity, new)
         if old == "off" and new == "on" and self.get_state(self.fan_entity) == "on":
             self.log("Restarted timer because the fan is on and the condition came on")
             self.restart_timer()
 
-    def timer_callback(self, kwargs):
-        # Receives timer events
+    def temperature_callback(self, entity, attribute, old, new, kwargs):
+        self.states.update(entity, new)
+        if self.band is None or not self.timer_handle.active:
+            return # Fan isn't running, the speed is picked when it turns on
 
-        # Clear timer
-        self.timer_handle = None 
+        temp = self.get_temperature()
+        if temp is None:
+            return
+        band = self.curve.update(temp, self.band)
+        if band != self.band and self.get_state(self.fan_entity) == "on":
+            speed = self.curve.speed(band)
+            self.log("Temperature is now {0}, changing {1} to {2}".format(temp, self.fan_entity, speed))
+            self.turn_on(self.fan_entity, percentage=speed)
+        self.band = band
 
+    def timer_callback(self, kwargs):
+        # Receives timer events
         if self.get_allowed():
             # Turn off fan if allowed
             self.fan_off()            
@@ -111,13 +180,25 @@ class MotionFan(hass.Hass):
         # Turns on fan, and pick speed
         # This section won't run unless the condition allows for it 
 
-        temp = float(self.get_state(self.temperature_entity))
-        speed = self.speed_map(temp)
+        temp = self.get_temperature()
+        if temp is None:
+            self.log("Temperature {0} is unknown, using the highest speed".format(self.temperature_entity))
+            band = self.curve.bands() - 1
+        elif self.band is None:
+            band = self.curve.band(temp)
+        else:
+            band = self.curve.update(temp, self.band)
+        changed = band != self.band
+        self.band = band
+        speed = self.curve.speed(band)
 
-        if self.timer_handle: # If there is an active timer
+        if self.timer_handle.active: # If there is an active timer
             if self.get_state(self.fan_entity) == "off":
                 self.log("Potential issue: fan is off even though there is an active timer. Did someone turn it off?")
                 self.turn_on(self.fan_entity, percentage=speed)
+            elif changed:
+                self.log("Changing {0} to {1}".format(self.fan_entity, speed))
+                self.turn_on(self.fan_entity, percentage=speed)
         else: # If there isn't an active timer
             self.log("Activating {0} to {1}".format(self.fan_entity, speed))
             self.turn_on(self.fan_entity, percentage=speed)
@@ -127,16 +208,15 @@ class MotionFan(hass.Hass):
 
     def fan_off(self):
         self.log("Turning off {0}".format(self.fan_entity))
+        self.band = None
         self.turn_off(self.fan_entity)
 
     def restart_timer(self):
-        if self.timer_handle != None:
-            self.cancel_timer(self.timer_handle)
-        self.timer_handle = self.run_in(self.timer_callback, self.delay)
+        self.timer_handle.restart(self.delay)
 
     def get_allowed(self):
         if self.condition_entity:
-            automation_allowed = self.get_state(self.condition_entity)
+            automation_allowed = self.states.get(self.condition_entity)
         else:
             automation_allowed = "on"
         
@@ -145,29 +225,41 @@ class MotionFan(hass.Hass):
         else: 
             return False
 
-    def speed_map(self, temp):
-        pmap = {"high": 100, "medium": 67, "low": 33, "off": 0}
-        
-        # Aggressive cooling
-        if self.speedmode == 1: # 
-            if temp > 75:
-                return(pmap["high"])
-            elif temp > 72:
-                return(pmap["medium"])
-            elif temp > 65:
-                return(pmap["low"])
-            else:
-                return(pmap["off"])
-
-        # Slightly less aggressive cooling
-        elif self.speedmode == 2:
-            if temp > 79:
-                return(pmap["high"])
-            elif temp > 72:
-                return(pmap["medium"])
-            elif temp > 65:
-                return(pmap["low"])
-            else:
-                return(pmap["off"])
+    def get_temperature(self):
+        try:
+            return float(self.states.get(self.temperature_entity))
+        except (ValueError, TypeError):
+            return None
+
+
+class SpeedCurve:
+    # Fan speed curve, loaded once from (temperature, percentage) breakpoints into sorted lists
+    #
+    # Band 0 is below the first breakpoint (off), band n is above the n-th breakpoint. band() is a bisect
+    # lookup. update() only moves to another band once the temperature is `hysteresis` degrees past the
+    # breakpoint, so a temperature hovering around a breakpoint doesn't flip the speed back and forth.
+
+    def __init__(self, breakpoints, hysteresis=0.5):
+        points = sorted((float(t), int(p)) for t, p in breakpoints)
+        self.temps = [t for t, p in points]
+        self.speeds = [0] + [p for t, p in points]
+        self.hysteresis = hysteresis
+
+    def bands(self):
+        return len(self.speeds)
+
+    def band(self, temp):
+        # Number of breakpoints the temperature is above
+        return bisect.bisect_left(self.temps, temp)
 
+    def update(self, temp, current):
+        up = self.band(temp - self.hysteresis)
+        if up > current:
+            return up
+        down = self.band(temp + self.hysteresis)
+        if down < current:
+            return down
+        return current
 
+    def speed(self, band):
+        return self.speeds[band]
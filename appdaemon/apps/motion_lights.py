@@ -1,6 +1,15 @@
 import hassapi as hass
-
-__version__ = "2022-02-04"
+import instrumentation
+import recorder
+import entity_index
+import deadline_timer
+import light_batch
+import state_cache
+import async_actions
+import app_state
+import threading
+
+__version__ = "2026-10-18"
 
 # Motion Lights
 # App to Automatically control lights based on motion or other activity
@@ -27,96 +36,236 @@ __version__ = "2022-02-04"
 # off_modifier: When this entity is on, brightness_off is the off mode, when this entity is off 
 #   brightness_off will be ignored and the light will actually turn off. This allows you to have different behaviors during certain conditions
 #
+# class: AsyncMotionLights instead of MotionLights runs the callbacks on AppDaemon's event loop (see async_actions.py),
+#   AsyncMotionLightsEngine and AsyncRoomLights do the same for the other two apps
 #
 
-class MotionLights(hass.Hass):
+class MotionLights(app_state.SavedState, recorder.Recorder, instrumentation.Instrumentation, hass.Hass):
+    def initialize(self):
+        # Opt-in callback timing (see instrumentation.py), has to run before any callback is registered
+        self.setup_instrumentation("motion_callback", "condition_callback")
+        self.setup_recorder() # Opt-in callback and action recording (see recorder.py)
+
+        self.room = None
+
+        # Light calls skip lights that are already in the requested state (see light_batch.py)
+        self.index = entity_index.attach(self)
+        self.lights = light_batch.LightBatch(self, self.index)
+
+        # Condition state is cached and kept current by condition_callback (see state_cache.py)
+        self.states = state_cache.StateCache(self, index=self.index)
+
+        try:
+            self.room = LightRoom(self, self.args)
+        except ValueError as e:
+            self.error(str(e))
+            return
+
+        for entity in self.room.sensors:
+            self.listen_state(self.motion_callback, entity)
+
+        # Check for condition entity, subscribe
+        if self.room.condition_entity:
+            self.states.track(self.room.condition_entity)
+            self.listen_state(self.condition_callback, self.room.condition_entity)
+
+        # Clean up light current state, keeping the off deadline from before a reload (see app_state.py)
+        deadlines = self.load_saved_state().get("deadlines", {})
+        self.room.startup(deadlines.get(self.room.entity_on))
+
+    def terminate(self):
+        if self.room:
+            self.save_state({"deadlines": {self.room.entity_on: self.room.timer.deadline}})
+            self.room.timer.cancel()
+        entity_index.detach(self)
+        self.stop_recorder()
+
+    def motion_callback(self, entity, attribute, old, new, kwargs):
+        self.room.motion(entity, old, new)
+
+    def condition_callback(self, entity, attribute, old, new, kwargs):
+        self.states.update(entity, new)
+        self.room.condition_changed(old, new)
+
+
+# Motion Lights Engine
+#
+# Runs many MotionLights rooms from one app instance. Every room takes the same args as MotionLights, 
+# and behaves the same way, but all rooms share one listener per sensor/condition entity instead of 
+# each room having its own app with its own listeners.
+#
+# Args:
+#
+# rooms: List of rooms, each one with the MotionLights args. name is optional and used in the logs
+#   - name: hallway
+#     sensor: binary_sensor.hallway_motion
+#     entity_on: light.hallway
+#   - name: front
+#     sensor:
+#       - binary_sensor.front_door_contact
+#       - binary_sensor.front_door_motion
+#     entity_on: light.outside_front_door_light
+#     brightness_on: 100
+#     brightness_off: 25
+#     condition: input_boolean.front_light_automation
+
+class MotionLightsEngine(app_state.SavedState, recorder.Recorder, instrumentation.Instrumentation, hass.Hass):
     def initialize(self):
-        # Create a variable to store the timer handle
-        self.handle = None 
+        # Opt-in callback timing (see instrumentation.py), has to run before any callback is registered
+        self.setup_instrumentation("motion_callback", "condition_callback")
+        self.setup_recorder() # Opt-in callback and action recording (see recorder.py)
+
+        self.rooms = []
+        self.sensor_rooms = {} # sensor -> rooms triggered by it
+        self.condition_rooms = {} # condition entity -> rooms using it
+
+        self.index = entity_index.attach(self)
+        self.lights = light_batch.LightBatch(self, self.index)
+        self.states = state_cache.StateCache(self, index=self.index)
+
+        if "rooms" in self.args:
+            rooms = self.args["rooms"]
+        else:
+            self.error("No rooms specified. Please edit your app configuration")
+            rooms = []
+
+        for i, args in enumerate(rooms):
+            name = args.get("name", "room{0}".format(i))
+            try:
+                room = LightRoom(self, args, name=name)
+            except ValueError as e:
+                self.error("Skipping room {0}: {1}".format(name, e))
+                continue
+            self.rooms.append(room)
+            for sensor in room.sensors:
+                self.sensor_rooms.setdefault(sensor, []).append(room)
+            if room.condition_entity:
+                self.condition_rooms.setdefault(room.condition_entity, []).append(room)
+
+        # One listener per entity, shared by all the rooms that use it
+        for sensor in self.sensor_rooms:
+            self.listen_state(self.motion_callback, sensor)
+        for condition in self.condition_rooms:
+            self.states.track(condition)
+            self.listen_state(self.condition_callback, condition)
+
+        self.log("Loaded {0} rooms, {1} sensors, {2} conditions".format(len(self.rooms), len(self.sensor_rooms), len(self.condition_rooms)))
+
+        deadlines = self.load_saved_state().get("deadlines", {}) # entity_on -> off deadline before a reload
+        for room in self.rooms:
+            room.startup(deadlines.get(room.entity_on))
+
+    def terminate(self):
+        self.save_state({"deadlines": {room.entity_on: room.timer.deadline for room in self.rooms}})
+        for room in self.rooms:
+            room.timer.cancel()
+        entity_index.detach(self)
+        self.stop_recorder()
+
+    def motion_callback(self, entity, attribute, old, new, kwargs):
+        for room in self.sensor_rooms.get(entity, ()):
+            room.motion(entity, old, new)
+
+    def condition_callback(self, entity, attribute, old, new, kwargs):
+        self.states.update(entity, new)
+        for room in self.condition_rooms.get(entity, ()):
+            room.condition_changed(old, new)
+
+
+class LightRoom:
+    # Settings, off timer and decision logic for one light, shared by MotionLights and MotionLightsEngine
+    # The app provides log/error, the shared entity index, the light_batch and the state_cache
+
+    __slots__ = ("app", "name", "delay", "brightness_on", "brightness_off", "entity_on", "entity_off", "sensors", "condition_entity", "timer")
+
+    def __init__(self, app, args, name=None):
+        self.app = app
+        self.name = name
+
+        # Off timer, motion only pushes back its deadline (see deadline_timer.py)
+        self.timer = deadline_timer.DeadlineTimer(app, app.instrument("timer_callback", self.timer_callback))
 
         # Check for delay, and set default if needed
-        if "delay" in self.args:
-            self.delay = self.args["delay"]
+        if "delay" in args:
+            self.delay = args["delay"]
         else:
             self.delay = 300 # 5 Minutes
 
-        if "brightness_on" in self.args:
-            self.brightness_on = brightness_up(self.args["brightness_on"])
+        if "brightness_on" in args:
+            self.brightness_on = brightness_up(args["brightness_on"])
         else:
             self.brightness_on = False
         
-        if "brightness_off" in self.args:
-            self.brightness_off = brightness_up(self.args["brightness_off"])
+        if "brightness_off" in args:
+            self.brightness_off = brightness_up(args["brightness_off"])
         else:
             self.brightness_off = False
 
-        if "entity_on" in self.args:
-            self.entity_on = self.args["entity_on"]
+        if "entity_on" in args:
+            self.entity_on = args["entity_on"]
         else:
-            self.error("No entity on specfied")
+            raise ValueError("No entity on specfied")
 
-        if "entity_off" in self.args:
-            self.entity_off = self.args["entity_off"]
+        if "entity_off" in args:
+            self.entity_off = args["entity_off"]
         else:
-            #self.log("No entity off specfied, using entity_on ({0})".format(self.entity_on))
             self.entity_off = self.entity_on
 
         # Check if sensor entity or sensor entity list is defined
-        if "sensor" in self.args:
-            sensor = self.args["sensor"]
+        if "sensor" in args:
+            sensor = args["sensor"]
             if type(sensor) == str:
                 # Single entity
-                self.listen_state(self.motion_callback, self.args["sensor"])
-                #self.log("Subscribing to sensor {0}".format(sensor))
-            elif type(sensor) == list:
-                #self.log("Subscribing to sensors {0}".format(sensor))
-                for entity in sensor:
-                    self.listen_state(self.motion_callback, entity)
+                self.sensors = [sensor]
+            else:
+                self.sensors = list(sensor)
         else:
-            self.error("No sensor specified. Please edit your app configuration")
+            raise ValueError("No sensor specified. Please edit your app configuration")
 
-        # Check for condition entity, subscribe and set variable
-        if "condition" in self.args:
-            self.condition_entity = self.args["condition"]
-            self.listen_state(self.condition_callback, self.condition_entity)
-            #self.log("Subscribed to condition {0}".format(self.condition_entity))
+        # Check for condition entity
+        if "condition" in args:
+            self.condition_entity = args["condition"]
         else:
             self.condition_entity = False
-        
+
+    def log(self, message):
+        if self.name:
+            message = "[{0}] {1}".format(self.name, message)
+        self.app.log(message)
+
+    def startup(self, deadline=None):
         # Clean up light current state 
         # This helps fix lights after a restart
-        if self.get_state(self.entity_on) == "on":
+        # deadline: Off timer deadline saved before a reload (see app_state.py), used instead of a full delay
+        index = self.app.index
+        if index.get_state(self.entity_on) == "on":
             if self.condition_entity:
-                if self.get_state(self.condition_entity) == "off":
+                if self.app.states.get(self.condition_entity) == "off":
                     self.log("The light is currently on, but the condition doesn't allow it to be on. Turning off")
                     self.light_off()
                 else:
                     if self.brightness_off:
                         # The light and condition are on, check if it is at brightness_off and restart timer if not
-                        current_brightness = self.get_state(self.entity_on, attribute="brightness")
+                        current_brightness = index.get_state(self.entity_on, attribute="brightness")
                         # Check if the numbers are within 2 of each other (to avoid conversion issues)
                         if (abs(current_brightness - self.brightness_off) <= 2):
                             self.log("Detected light is already at the brightness_off value, leaving alone")
                         else:
                             self.log("Restarted timer because the light is at {0} and brightness_off is {1}".format(current_brightness, self.brightness_off))
-                            self.restart_timer()
+                            self.resume_timer(deadline)
                     else:
                         #The light doesn't have a brightness_off set, restart the timer since it is on
                         self.log("Restarted timer because the light is currently on")
-                        self.restart_timer()
+                        self.resume_timer(deadline)
             else:
                 # The light is on, and there is no condition. It could be on from a previous activation. Restart the timer
                 # This gives the event time to happen again to keep the light on
                 self.log("Detected light is on, Restarting timer")
-                self.restart_timer()    
-
-    def terminate(self):
-        if self.handle != None:
-            self.cancel_timer(self.handle)
+                self.resume_timer(deadline)    
 
-    def motion_callback(self, entity, attribute, old, new, kwargs):
+    def motion(self, entity, old, new):
         if self.condition_entity:
-            automation_allowed = self.get_state(self.condition_entity)
+            automation_allowed = self.app.states.get(self.condition_entity)
         else:
             automation_allowed = "on"
 
@@ -124,18 +273,20 @@ class MotionLights(hass.Hass):
             self.log("Triggered by state of {0}".format(entity))
             self.light_on()
 
-    def condition_callback(self, entity, attribute, old, new, kwargs):
+    def condition_changed(self, old, new):
+        index = self.app.index
+
         # If the condition entity just switched on, and there is a brightness_off defined, turn on the light to the "off" brightness
         if (old == "off" and new == "on") and self.brightness_off:
-            if self.get_state(self.entity_on) == "off":
-                self.turn_on(self.entity_on, brightness=self.brightness_off)
+            if index.get_state(self.entity_on) == "off":
+                self.app.lights.turn_on(self.entity_on, brightness=self.brightness_off)
                 self.log("Turned on {0} to brightness_off {1} because condition just turned on".format(self.entity_on, self.brightness_off)) 
 
         # If the off modifier entity just switched off, and the light is on *at the brightness_off* level turn off the light
         # *add me
         if (old == "on" and new == "off"):
-            current_state = self.get_state(self.entity_on)
-            current_brightness = self.get_state(self.entity_on, attribute="brightness")
+            current_state = index.get_state(self.entity_on)
+            current_brightness = index.get_state(self.entity_on, attribute="brightness")
             if (current_state == "on"):
                 if self.brightness_off == False: #If brightness isn't defined
                     self.log("Restarted timer because condition turned off while the light is on")
@@ -145,29 +296,28 @@ class MotionLights(hass.Hass):
                     # Check if the numbers are within 2 of each other (to avoid conversion issues)
                     if (abs(current_brightness - self.brightness_off) <= 2):
                         self.log("Turned off because condition just turned off while at the brightness_off value".format(self.entity_on))
-                        self.turn_off(self.entity_off) 
+                        self.app.lights.turn_off(self.entity_off) 
                     else:
                         self.log("Restarted timer because condition turned off, while the light is on ({0}) (But not at the brightness_off value {1}".format(current_brightness, self.brightness_off))
                         self.restart_timer()
             
     def timer_callback(self, kwargs):
         # Receives timer events
-        self.handle = None 
         self.light_off()            
             
     def light_on(self):
         # Turns on light, if brightness_on is defined turns on light to brightness
         # This section won't run unless the condition allows for it
 
-        if self.handle: # If there is an active timer
+        if self.timer.active: # If there is an active timer
             self.log("Extending timer")
         else: # If there isn't an active timer
             if self.brightness_on:
                 self.log("Turning {0} on to brightness {1} and restarting timer".format(self.entity_on, self.brightness_on))
-                self.turn_on(self.entity_on, brightness=self.brightness_on)
+                self.app.lights.turn_on(self.entity_on, brightness=self.brightness_on)
             else:
                 self.log("Turning {0} on and restarting timer".format(self.entity_on))
-                self.turn_on(self.entity_on)
+                self.app.lights.turn_on(self.entity_on)
        
         # Restart off timers
         self.restart_timer()
@@ -177,28 +327,34 @@ class MotionLights(hass.Hass):
         if self.brightness_off:
             if self.condition_entity:
                 # If a brightness_off and condition is defined
-                current_state = self.get_state(self.condition_entity)
+                current_state = self.app.states.get(self.condition_entity)
                 if current_state == "on":
                     # If condition is currently on, set light to the brightness_off level instead of turning it off
                     self.log("Setting {0} to brightness {1}".format(self.entity_off, self.brightness_off))
-                    self.turn_on(self.entity_on, brightness=self.brightness_off)
+                    self.app.lights.turn_on(self.entity_on, brightness=self.brightness_off)
                 if current_state == "off":
                     # If the condition is off, turn off the light
                     self.log("Turning {} off".format(self.entity_off))
-                    self.turn_off(self.entity_off)
+                    self.app.lights.turn_off(self.entity_off)
             else:
                 # No condition, but brightness_off - set light to brightness_off
                 self.log("Setting {0} to brightness {1}".format(self.entity_off, self.brightness_off))
-                self.turn_on(self.entity_on, brightness=self.brightness_off)
+                self.app.lights.turn_on(self.entity_on, brightness=self.brightness_off)
         else:
             # No brightness off, turn light off
             self.log("Turning {} off".format(self.entity_off))
-            self.turn_off(self.entity_off)
+            self.app.lights.turn_off(self.entity_off)
 
     def restart_timer(self):
-        if self.handle != None:
-            self.cancel_timer(self.handle)
-        self.handle = self.run_in(self.timer_callback, self.delay)
+        self.timer.restart(self.delay)
+
+    def resume_timer(self, deadline):
+        # Startup: keeps the off deadline from before a reload, or starts a full delay if there is none
+        if deadline is None:
+            self.restart_timer()
+        else:
+            self.timer.restore(deadline)
+            self.log("Restored timer, {0:.0f} seconds left".format(self.timer.remaining()))
 
 
 def brightness_up(brightness):
@@ -232,13 +388,21 @@ def brightness_up(brightness):
 #   delay: #Delay in minutes. Defaults to 30 minutes, delay to shut of lights after no room activity
 #   condition: #Entity that must be on for automation overrides to take place
 #   debug: #Adds extra logging
+#
+# class: AsyncRoomLights instead of RoomLights runs the callbacks on AppDaemon's event loop (see async_actions.py)
 
-class RoomLights(hass.Hass):
+class RoomLights(app_state.SavedState, recorder.Recorder, instrumentation.Instrumentation, hass.Hass):
     def initialize(self):
-        # Create a variable to store the timer handle
-        self.timer_handle = None 
+        # Opt-in callback timing (see instrumentation.py), has to run before any callback is registered
+        self.setup_instrumentation("motion_callback", "condition_callback", "lightmode_callback", "timer_callback")
+        self.setup_recorder() # Opt-in callback and action recording (see recorder.py)
+
+        # Off timer, motion only pushes back its deadline (see deadline_timer.py)
+        self.timer_handle = deadline_timer.DeadlineTimer(self, self.timer_callback)
+        self.scene_lock = threading.Lock() #Scenes can change from the entity index listener while a callback runs
         self.scene_map = {} #stores mapping of light mode name to scene entity
-        self.all_light_entities = [] #Stores discovered list of all lights referenced in any scenes. Used to shut lights off
+        self.scene_lights = {} #scene entity -> lights in that scene
+        self.all_light_entities = {} #Ordered set of all lights referenced in any scenes (light -> number of scenes). Used to shut lights off
         self.debug = False
 
         # Check if debug logging is enabled
@@ -254,26 +418,26 @@ class RoomLights(hass.Hass):
         else:
             self.error("No Room Prefix Defined, Please edit your app configuration")
 
-        hastate = self.get_state() #Get Device List from HA
-        for e in hastate: 
-            if self.sceneprefix in e: #Find scenes matching name of room
-                lightmode = e.replace(self.sceneprefix, "") 
-                self.scene_map[lightmode] = e
-                for light in hastate[e]["attributes"]["entity_id"]: #Find light entities in scene and add to list
-                    if not light in self.all_light_entities:
-                        self.all_light_entities.append(light)
+        self.index = entity_index.attach(self) #Shared device list, see entity_index.py
+        self.lights = light_batch.LightBatch(self, self.index) #Sends all the lights in one call
+        self.states = state_cache.StateCache(self, index=self.index) #Condition state, kept current by condition_callback
+        for e in self.index.with_prefix(self.sceneprefix): #Find scenes matching name of room
+            self.add_scene(e, self.index.get(e))
+        sceneprefix = self.sceneprefix
+        self.index.add_listener(self, self.scene_changed, match=lambda entity, old, new: entity.startswith(sceneprefix)) #Keep the scenes current when they are added, removed or edited
 
         self.debuglog("Detected Scenes: {0}".format(self.scene_map))
-        self.debuglog("Detected Lights: {0}".format(self.all_light_entities))
+        self.debuglog("Detected Lights: {0}".format(self.light_entities()))
 
         if "lightmodeselect" in self.args:
             self.lightmodeselect = self.args["lightmodeselect"]
+            self.states.track(self.lightmodeselect)
             self.listen_state(self.lightmode_callback, self.lightmodeselect)
         else:
             self.error("lightmodeselect not defined, please edit app configuration")
 
         # Verify light mode select entity. Checks if scenes were found for each
-        selectdata = hastate[self.lightmodeselect]
+        selectdata = self.index.get(self.lightmodeselect)
         for mode in selectdata["attributes"]["options"]:
             name = mode.lower()
             if not name in self.scene_map:
@@ -302,30 +466,71 @@ class RoomLights(hass.Hass):
             centity = self.args["condition"]
             self.debuglog("Using condition: "+centity)
             self.condition_entity = centity
+            self.states.track(centity)
             self.listen_state(self.condition_callback, centity) 
         else:
             self.condition_entity = False
 
         # Check if any lights are on right now and schedule timer if that is the case
         active = False
-        for light in self.all_light_entities:
-            if self.get_state(light) == "on":
+        for light in self.light_entities():
+            if self.index.get_state(light) == "on":
                 active = True
-        if active == True:
+        deadline = self.load_saved_state().get("deadline") # Off deadline from before a reload (see app_state.py)
+        if active == True and deadline is not None:
+            self.timer_handle.restore(deadline)
+            self.log("Detected some lights that are on currently, restored shutdown in {0:.0f} seconds".format(self.timer_handle.remaining()))
+        elif active == True:
             self.log("Detected some lights that are on currently, scheduled shutdown for {0} seconds".format(self.delay))
             self.restart_timer()
 
     def terminate(self):
-        if self.timer_handle != None:
-            self.cancel_timer(self.timer_handle)
+        self.save_state({"deadline": self.timer_handle.deadline})
+        self.timer_handle.cancel()
+        entity_index.detach(self)
+        self.stop_recorder()
     
     def debuglog(self, message):
         if self.debug:
             self.log(message)
 
+    def add_scene(self, entity, state):
+        lights = scene_lights(state)
+        with self.scene_lock:
+            self.scene_map[entity[len(self.sceneprefix):]] = entity
+            self.scene_lights[entity] = lights
+            for light in lights:
+                self.all_light_entities[light] = self.all_light_entities.get(light, 0) + 1
+
+    def remove_scene(self, entity):
+        with self.scene_lock:
+            lightmode = entity[len(self.sceneprefix):]
+            if self.scene_map.get(lightmode) == entity:
+                del self.scene_map[lightmode]
+            for light in self.scene_lights.pop(entity, ()):
+                count = self.all_light_entities.get(light, 0) - 1
+                if count > 0:
+                    self.all_light_entities[light] = count
+                else:
+                    self.all_light_entities.pop(light, None)
+
+    def scene_changed(self, entity, old_state, new_state):
+        # Entity index listener for the scenes of this room, runs on this app's thread
+        if new_state is None:
+            self.remove_scene(entity)
+            self.debuglog("Scene removed: "+entity)
+        elif old_state is None or scene_lights(old_state) != scene_lights(new_state):
+            self.remove_scene(entity)
+            self.add_scene(entity, new_state)
+            self.debuglog("Scene updated: {0} {1}".format(entity, self.scene_lights[entity]))
+
+    def light_entities(self):
+        with self.scene_lock:
+            return list(self.all_light_entities)
+
     def motion_callback(self, entity, attribute, old, new, kwargs):
         if self.condition_entity:
-            automation_allowed = self.get_state(self.condition_entity)
+            automation_allowed = self.states.get(self.condition_entity)
         else:
             automation_allowed = "on"
 
@@ -334,6 +539,8 @@ class RoomLights(hass.Hass):
             self.lights_on()
     
     def condition_callback(self, entity, attribute, old, new, kwargs):
+        self.states.update(entity, new)
+
         #Condition turned on, update lights
         if old == "off" and new == "on":
             self.lights_update()
@@ -341,12 +548,13 @@ class RoomLights(hass.Hass):
         #For now doesn't do anything if the condition turned off other than block the light turning on again
     
     def lightmode_callback(self, entity, attribute, old, new, kwargs):
+        self.states.update(entity, new)
         if self.check_automation_allowed():
             self.lights_update()
     
     def check_automation_allowed(self):
         if self.condition_entity:
-            automation_allowed = self.get_state(self.condition_entity)
+            automation_allowed = self.states.get(self.condition_entity)
         else:
             automation_allowed = "on"
         if automation_allowed == "on":
@@ -356,9 +564,8 @@ class RoomLights(hass.Hass):
 
     def timer_callback(self, kwargs):
         # Receives timer events
-        self.timer_handle = None 
         if self.condition_entity:
-            automation_allowed = self.get_state(self.condition_entity)
+            automation_allowed = self.states.get(self.condition_entity)
         else:
             automation_allowed = "on"
 
@@ -368,15 +575,15 @@ class RoomLights(hass.Hass):
     def lights_update(self):
         # Light mode changed, if light timer is active, update scene.
 
-        lightmode = self.get_state(self.lightmodeselect).lower() #Get current light mode state
-        if lightmode in self.scene_map and self.timer_handle:
-            scene = self.scene_map[lightmode]
+        lightmode = self.states.get(self.lightmodeselect).lower() #Get current light mode state
+        scene = self.scene_map.get(lightmode)
+        if scene is not None and self.timer_handle.active:
             self.turn_on(scene)
             self.debuglog("Updated scene to "+scene)
 
         # If light timer isn't active, set light to off mode if it exists
 
-        if not self.timer_handle:
+        if not self.timer_handle.active:
             self.debuglog("Turning off lights since there is no active timer")
             self.lights_off()
 
@@ -384,16 +591,15 @@ class RoomLights(hass.Hass):
     def lights_on(self):
         # Turn on room lights because of motion
 
-        lightmode = self.get_state(self.lightmodeselect).lower() #Get current light mode state
+        lightmode = self.states.get(self.lightmodeselect).lower() #Get current light mode state
 
-        if lightmode in self.scene_map:
-            scene = self.scene_map[lightmode]
+        scene = self.scene_map.get(lightmode)
+        if scene is not None:
             self.turn_on(scene)
             self.log("Activating Scene: "+scene)
         else:
             #There was no matching scene for the current light mode, turn on all lights to the last brightness as a backup
-            for light in self.all_light_entities:
-                self.turn_on(light)
+            self.lights.turn_on(self.light_entities())
             self.log("No matching scene for mode {0}, turned on all lights to last brightness as a backup")
        
         # Restart off timers
@@ -401,17 +607,49 @@ class RoomLights(hass.Hass):
 
     def lights_off(self):
         #Turns off lights after motion delay
-        if "off" in self.scene_map: #If there is an "off" scene defined, activate it
-            self.turn_on(self.scene_map["off"])
-            self.log("Activating Scene: "+self.scene_map["off"])
+        scene = self.scene_map.get("off")
+        if scene is not None: #If there is an "off" scene defined, activate it
+            self.turn_on(scene)
+            self.log("Activating Scene: "+scene)
         else: #Otherwise, turn off all known light entitites
-            for light in self.all_light_entities:
-                self.turn_off(light)
+            self.lights.turn_off(self.light_entities())
             self.log("Couldn't find 'off' scene. Turned off all lights instead")
 
     def restart_timer(self):
-        if self.timer_handle != None:
-            self.cancel_timer(self.timer_handle)
-        self.timer_handle = self.run_in(self.timer_callback, self.delay)
-        
- 
\ No newline at end of file
+        self.timer_handle.restart(self.delay)
+
+
+def scene_lights(state):
+    # Light entities in a scene state (its entity_id attribute), as a tuple
+    try:
+        lights = state["attributes"]["entity_id"]
+    except (KeyError, TypeError):
+        return ()
+    if isinstance(lights, str):
+        return (lights,)
+    return tuple(lights)
+
+
+# Async variants, same behavior with the callbacks on AppDaemon's event loop (see async_actions.py)
+
+class AsyncMotionLights(async_actions.AsyncActions, MotionLights):
+    def initialize(self):
+        self.setup_async("motion_callback", "condition_callback")
+        super().initialize()
+        if self.room:
+            self.async_timer(self.room.timer)
+
+
+class AsyncMotionLightsEngine(async_actions.AsyncActions, MotionLightsEngine):
+    def initialize(self):
+        self.setup_async("motion_callback", "condition_callback")
+        super().initialize()
+        for room in self.rooms:
+            self.async_timer(room.timer)
+
+
+class AsyncRoomLights(async_actions.AsyncActions, RoomLights):
+    def initialize(self):
+        self.setup_async("motion_callback", "condition_callback", "lightmode_callback")
+        super().initialize()
+        self.async_timer(self.timer_handle)
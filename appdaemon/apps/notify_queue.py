@@ -0,0 +1,118 @@
+import threading
+
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/notify_queue.py
+#
+# Notification queue
+#
+# send() only adds the message to a queue and returns, the notify calls are made later from a scheduler
+# callback. Messages for the same target that arrive within `window` seconds are sent together, and
+# a target gets at most one push every `interval` seconds. Anything that arrives in between waits for
+# the next push.
+#
+# Messages sent with a summary ("Triggered", "Hall") are merged per title into one line:
+#   Triggered: Hall, Kitchen, Back Door (+5)
+# Other messages in the same push are kept as separate lines.
+#
+# Titles listed in `immediate` (life safety alarms) skip the window and the rate limit.
+#
+# Usage:
+#   import notify_queue
+#
+#   self.notifications = notify_queue.NotificationQueue(self, window=5, interval=15, immediate=["Smoke Alarm"])
+#   self.notifications.send("mobile_app", "Alert", "Triggered: Hall", summary=("Triggered", "Hall"))
+#   self.notifications.flush_all() # In terminate, so nothing queued is lost
+#
+# This module is not an app, it does not need an entry in apps.yaml.
+
+# Number of names listed in a merged line before it switches to (+N)
+SUMMARY_ITEMS = 3
+
+
+class NotificationQueue:
+    def __init__(self, app, window=5, interval=15, immediate=()):
+        self.app = app
+        self.window = window
+        self.interval = interval
+        self.immediate = set(immediate)
+        self.lock = threading.Lock()
+        self.pending = {} # target -> {title: [(message, summary)]}
+        self.handles = {} # target -> scheduled flush timer
+        self.flush_at = {} # target -> time the scheduled flush runs
+        self.last_sent = {} # target -> time of the last push
+        self.sent = 0 # Notify calls made
+        self.queued = 0 # Messages queued
+
+    def send(self, target, title, message, summary=None, type=None):
+        # type is what gets checked against `immediate`, defaults to the title
+        if type is None:
+            type = title
+        now = self.app.get_now_ts()
+        with self.lock:
+            self.queued += 1
+            self.pending.setdefault(target, {}).setdefault(title, []).append((message, summary))
+
+            if type in self.immediate:
+                when = now
+            else:
+                when = max(now + self.window, self.last_sent.get(target, 0) + self.interval)
+
+            if target in self.handles:
+                if self.flush_at[target] <= when:
+                    return # Already scheduled early enough
+                self.app.cancel_timer(self.handles[target])
+            self.flush_at[target] = when
+            self.handles[target] = self.app.run_in(self.flush_callback, max(when - now, 0), target=target)
+
+    def flush_callback(self, kwargs):
+        self.flush(kwargs["target"], timer_fired=True)
+
+    def flush_all(self):
+        for target in list(self.pending):
+            self.flush(target)
+
+    def flush(self, target, timer_fired=False):
+        with self.lock:
+            groups = self.pending.pop(target, {})
+            handle = self.handles.pop(target, None)
+            self.flush_at.pop(target, None)
+            if groups:
+                self.last_sent[target] = self.app.get_now_ts()
+
+        if handle is not None and not timer_fired:
+            self.app.cancel_timer(handle)
+
+        for title, entries in groups.items():
+            self.sent += 1
+            self.app.notify(combine(entries) + "\n", title=title, name=target)
+
+
+def combine(entries):
+    # Builds one message from the queued (message, summary) entries of one title
+    if len(entries) == 1:
+        return entries[0][0]
+
+    lines = []
+    summaries = {} # label -> names, in order of arrival
+    for message, summary in entries:
+        if summary is None:
+            lines.append(message)
+        else:
+            label, name = summary
+            if not label in summaries:
+                summaries[label] = []
+                lines.append((label,)) # Placeholder, keeps the position of the first one
+            if not name in summaries[label]:
+                summaries[label].append(name)
+
+    for i, line in enumerate(lines):
+        if isinstance(line, tuple):
+            label = line[0]
+            names = summaries[label]
+            text = ", ".join(names[:SUMMARY_ITEMS])
+            if len(names) > SUMMARY_ITEMS:
+                text += " (+{0})".format(len(names) - SUMMARY_ITEMS)
+            lines[i] = "{0}: {1}".format(label, text)
+    return "\n".join(lines)
@@ -0,0 +1,246 @@
+import asyncio
+import functools
+import inspect
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/recorder.py
+#
+# Callback and action recorder
+#
+# Mixin for the apps that writes everything an app receives (state callbacks, events, timers) and everything
+# it does (service calls, notifications, set_state) to a file, so a misbehaving app can be replayed offline
+# with bench/replay_recording.py and the actions compared.
+#
+# It is off unless the app has the "record" arg. When off nothing is wrapped.
+#
+# File layout: <record dir>/<app name>.rec, a series of frames. A frame is a 4 byte big endian length followed
+# by a zlib compressed block of JSON lines, one record per line:
+#   ["h", time, {"app", "module", "class", "args", "states"}]  header, written when the app starts and at the top of every file
+#   ["s", time, entity, attribute, old, new]                    state callback
+#   ["e", time, event, data]                                    event callback (state_changed only for tracked entities)
+#   ["t", time, callback name]                                  timer callback
+#   ["a", time, call, args]                                     action (turn_on, call_service, notify, ...)
+# Records are buffered and a frame is written every `BLOCK` records or `FLUSH_SECONDS` seconds, so recording an
+# event costs a json.dumps and a list append. When the file gets bigger than record_max_bytes it is rotated to
+# .rec.1, .rec.2, ... and the new file starts with a fresh header (including a new state dump).
+#
+# state_changed event listeners see every entity in HA, only the changes of entities the app tracks are recorded
+# so a recording grows with the app's inputs instead of the whole house. By default those are the entities passed
+# to listen_state, an app listening to state_changed itself overrides record_tracks(entity, new_state).
+# The entity index subscription (see entity_index.py) is registered past the wrappers and never recorded.
+#
+# Args (on the app using the mixin):
+#   record: Enable recording. true records to the "recordings" folder in the AppDaemon config folder,
+#           a path records to that folder instead
+#   record_max_bytes: Size a file is rotated at. Defaults to 1000000
+#   record_files: Number of rotated files kept. Defaults to 3
+#
+# Usage:
+#   import recorder
+#
+#   class MyApp(recorder.Recorder, hass.Hass):
+#       def initialize(self):
+#           # Before any callback is registered
+#           self.setup_recorder()
+#
+#       def terminate(self):
+#           self.stop_recorder() # Writes out the buffered records
+#
+# This module is not an app, it does not need an entry in apps.yaml.
+
+BLOCK = 64
+FLUSH_SECONDS = 10
+LENGTH = struct.Struct(">I")
+
+ACTION_CALLS = ("call_service", "turn_on", "turn_off", "toggle", "notify", "set_state")
+TIMER_CALLS = ("run_in", "run_every", "run_daily")
+
+
+class Recorder:
+    def setup_recorder(self):
+        self.recording = "record" in self.args
+        if not self.recording:
+            return
+
+        directory = self.args["record"]
+        if not isinstance(directory, str):
+            directory = os.path.join(self.config_dir, "recordings")
+        max_bytes = int(self.args.get("record_max_bytes", 1000000))
+        files = int(self.args.get("record_files", 3))
+
+        self.record_local = threading.local() # Nested action calls (turn_on calling call_service) are recorded once
+        self.record_entities = set() # Entities passed to listen_state, see record_tracks
+        self.record_dump = self.get_state # Unwrapped, for the header state dump
+        self.record_writer = RecordWriter(os.path.join(directory, self.name + ".rec"), max_bytes, files, self.record_header)
+
+        self.listen_state = self.record_listener(self.track_entities(self.listen_state), self.record_state)
+        self.listen_event = self.record_listener(self.listen_event, self.record_event)
+        for name in TIMER_CALLS:
+            setattr(self, name, self.record_listener(getattr(self, name), self.record_timer))
+        for name in ACTION_CALLS:
+            setattr(self, name, self.record_action(name, getattr(self, name)))
+
+    def stop_recorder(self):
+        if getattr(self, "recording", False):
+            self.record_writer.close()
+
+    def record_header(self):
+        args = {k: v for k, v in self.args.items() if not k.startswith("record")}
+        return ["h", self.get_now_ts(), {"app": self.name, "module": self.args.get("module"), "class": self.args.get("class"),
+                                         "args": args, "states": self.record_dump()}]
+
+    def record_listener(self, register, wrap):
+        # Wraps a listen_*/run_* call so the callback it registers is recorded when it runs
+        @functools.wraps(register)
+        def registered(callback, *args, **kwargs):
+            return register(wrap(callback), *args, **kwargs)
+        return registered
+
+    def track_entities(self, register):
+        # Remembers the entities of a listen_state call for record_tracks
+        @functools.wraps(register)
+        def registered(callback, entity_id=None, *args, **kwargs):
+            if isinstance(entity_id, str):
+                self.record_entities.add(entity_id)
+            elif entity_id is not None:
+                self.record_entities.update(entity_id)
+            return register(callback, entity_id, *args, **kwargs)
+        return registered
+
+    def record_tracks(self, entity, new_state):
+        # True if a state_changed event for entity is one of the app's inputs and should be recorded
+        return entity in self.record_entities
+
+    def record_state(self, callback):
+        return self.record_callback(callback, lambda ts, entity, attribute, old, new, kwargs: ["s", ts, entity, attribute, old, new])
+
+    def record_event(self, callback):
+        def record(ts, event_name, data, kwargs):
+            if event_name == "state_changed" and not self.record_tracks(data.get("entity_id"), data.get("new_state")):
+                return None
+            return ["e", ts, event_name, data]
+        return self.record_callback(callback, record)
+
+    def record_timer(self, callback):
+        name = getattr(callback, "__name__", str(callback))
+        return self.record_callback(callback, lambda ts, kwargs: ["t", ts, name])
+
+    def record_callback(self, callback, record):
+        # Wraps callback so record(time, *callback args) is written before it runs, unless it returns None.
+        # Async callbacks stay async
+        writer = self.record_writer
+
+        if asyncio.iscoroutinefunction(callback):
+            @functools.wraps(callback)
+            async def recorded(*args):
+                ts = self.get_now_ts()
+                if inspect.isawaitable(ts): # AppDaemon API calls return futures on the event loop
+                    ts = await ts
+                line = record(ts, *args)
+                if line is not None:
+                    writer.add(line)
+                return await callback(*args)
+        else:
+            @functools.wraps(callback)
+            def recorded(*args):
+                line = record(self.get_now_ts(), *args)
+                if line is not None:
+                    writer.add(line)
+                return callback(*args)
+        return recorded
+
+    def record_action(self, name, function):
+        writer = self.record_writer
+        local = self.record_local
+
+        @functools.wraps(function)
+        def recorded(*args, **kwargs):
+            if getattr(local, "depth", 0) == 0:
+                writer.add(["a", self.get_now_ts(), name, [list(args), kwargs]])
+            local.depth = getattr(local, "depth", 0) + 1
+            try:
+                return function(*args, **kwargs)
+            finally:
+                local.depth -= 1
+        return recorded
+
+
+class RecordWriter:
+    def __init__(self, path, max_bytes=1000000, files=3, header=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.files = files
+        self.header = header # Function returning the header record of a new file
+        self.lock = threading.Lock()
+        self.block = []
+        self.flushed = time.monotonic()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = None
+        self.open()
+
+    def open(self):
+        # Every app start and every rotated file begins with a header
+        self.file = open(self.path, "ab")
+        if self.header is not None:
+            self.block.append(encode(self.header()))
+
+    def add(self, record):
+        line = encode(record)
+        with self.lock:
+            self.block.append(line)
+            if len(self.block) >= BLOCK or time.monotonic() - self.flushed > FLUSH_SECONDS:
+                self.flush()
+
+    def flush(self):
+        # Called with the lock held
+        self.flushed = time.monotonic()
+        if not self.block:
+            return
+        payload = zlib.compress("\n".join(self.block).encode())
+        self.block = []
+        self.file.write(LENGTH.pack(len(payload)) + payload)
+        self.file.flush()
+        if self.file.tell() > self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.files - 1, 0, -1):
+            older = "{0}.{1}".format(self.path, i)
+            if os.path.exists(older):
+                os.replace(older, "{0}.{1}".format(self.path, i + 1))
+        os.replace(self.path, self.path + ".1")
+        self.open()
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.file.close()
+
+
+def encode(record):
+    return json.dumps(record, separators=(",", ":"), default=str)
+
+
+def read_records(path):
+    # Yields the records of a recording file, oldest first. A partly written last frame is skipped
+    with open(path, "rb") as f:
+        while True:
+            prefix = f.read(LENGTH.size)
+            if len(prefix) < LENGTH.size:
+                return
+            payload = f.read(LENGTH.unpack(prefix)[0])
+            try:
+                block = zlib.decompress(payload)
+            except zlib.error:
+                return
+            for line in block.decode().split("\n"):
+                yield json.loads(line)
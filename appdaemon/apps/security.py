@@ -1,7 +1,15 @@
 import hassapi as hass
+import instrumentation
+import recorder
 import datetime
+import entity_index
+import notify_queue
+import async_actions
+import security_journal
+import threading
+import os
 
-__version__ = "2022-12-25"
+__version__ = "2026-10-18"
 
 # Source: 
 #
@@ -10,6 +18,7 @@ __version__ = "2022-12-25"
 #
 # Will locate all motion and door sensors, add entity ID's to ignored_sensors to ignore
 # Only watches doors in armed_home, watches doors and motion sensors in armed_away
+# Open doors are tracked all the time, arming with doors open sends one warning listing all of them
 #
 # Required:
 # arm_target - Entity id of helper to select arming state from HA (input_select helper)
@@ -21,9 +30,57 @@ __version__ = "2022-12-25"
 #  -
 #  -
 # debug: #Enable debug logging
-
-class ASM(hass.Hass):
+# notify_window: Seconds to collect notifications before sending them together. Defaults to 5
+# notify_interval: Minimum seconds between notifications. Defaults to 15. Smoke, CO and water alarms and the first
+#   trigger of an intrusion alarm are always sent right away, the triggers after it are merged into one message
+# water_shutoff: Valve entity to turn off when a leak sensor triggers
+# water_shutoff_delay: Seconds to wait before shutting off, the water stays on if the leak clears by then. Defaults to 60, 0 shuts off right away
+# water_shutoff_confirm: Seconds the valve has to report off after turn_off before it is retried. Defaults to 30
+# water_shutoff_retries: Number of retries before the valve is reported as failed. Defaults to 2
+#
+# Water shutoff runs as one state machine, published as sensor.<name>_water_shutoff:
+#   idle -> pending (waiting out water_shutoff_delay) -> closing (turn_off sent, waiting for the valve) -> closed
+# Leak sensors triggering while a shutoff is pending or running join it instead of starting another one.
+# If the valve doesn't report off in time it is retried, then the state goes to failed and a Water Alarm is sent.
+# The time from the first leak trigger to the valve reporting off is the last_latency attribute.
+# The valve being turned back on after a shutoff resets it to idle.
+#
+# journal_dir: Folder the security event journal is kept in. Defaults to security_journal in the AppDaemon config folder
+# journal_memory: Number of recent events kept in memory. Defaults to 1000
+# journal_segment_bytes: Size a journal file is closed at. Defaults to 1000000
+# journal_segments: Number of journal files kept. Defaults to 10
+# journal_endpoint: Name of the query endpoint, false to not register one. Defaults to <name>_journal
+#
+# Sensor triggers and clears, arm and alarm state changes, open doors at arming and water valve events are
+# kept in the journal (see security_journal.py). Query it with the endpoint, by time range, sensor and type:
+#   curl -X POST http://appdaemon:5050/api/appdaemon/asm_journal -d '{"start": "2026-01-31T02:00:00", "end": "2026-01-31T02:05:00"}'
+#   {"minutes": 60, "sensor": "binary_sensor.back_door", "type": "trigger", "limit": 100}
+# The newest `limit` matching events are returned (default 100, at most 1000), oldest first.
+# Event types: trigger, clear, arm, alarm, open_at_arming, shutoff, valve
+#
+# class: AsyncASM instead of ASM runs the callbacks on AppDaemon's event loop, with the HA calls of a callback
+# sent concurrently (see async_actions.py, async_limit arg). It behaves the same otherwise.
+#
+# Sensors paired or reclassified while the app is running are picked up from the entity index, no reload needed
+
+# device_class -> (sensor registry, listen handles, name used in the logs, callback, arm states the sensor is watched in,
+# new state the listener is filtered on). Sensors without arm states are always watched
+SENSOR_TYPES = {
+    "motion": ("motion_sensors", "motion_handles", "Motion", "motion_callback", ("armed_away",), "on"),
+    "door": ("door_sensors", "door_handles", "Door", "door_callback", None, None), # Opens and closes in every arm state, for open_doors
+    "tamper": ("tamper_sensors", "alarm_handles", "Tamper Sensor", "tamper_callback", None, None),
+    "moisture": ("leak_sensors", "alarm_handles", "Leak Sensor", "leak_callback", None, None),
+    "smoke": ("smoke_sensors", "alarm_handles", "Smoke Alarm", "smoke_callback", None, None),
+    "carbon_monoxide": ("co_sensors", "alarm_handles", "Carbon Monoxide Alarm", "co_callback", None, None),
+}
+
+class ASM(recorder.Recorder, instrumentation.Instrumentation, hass.Hass):
     def initialize(self):
+        # Opt-in callback timing (see instrumentation.py), has to run before any callback is registered
+        self.setup_instrumentation("smoke_callback", "co_callback", "leak_callback", "valve_state_callback", "tamper_callback",
+            "arm_target_callback", "motion_callback", "door_callback", "trigger_alarm", "handle_water_valve_finish", "water_confirm_callback")
+        self.setup_recorder() # Opt-in callback and action recording (see recorder.py)
+
         required = ["arm_target", "notify_target"]
         for a in required:
             if not a in self.args:
@@ -53,105 +110,185 @@ class ASM(hass.Hass):
             self.listen_state(self.valve_state_callback, entity_id=self.water_shutoff_entity)
         else:
             self.water_shutoff_entity = False
+        self.shutoff_delay = float(self.args.get("water_shutoff_delay", 60))
+        self.shutoff_confirm = float(self.args.get("water_shutoff_confirm", 30))
+        self.shutoff_retries = int(self.args.get("water_shutoff_retries", 2))
+        self.shutoff_state = "idle" # idle, pending, closing, closed or failed, see the header
+        self.shutoff_triggers = set() # Leak sensors that triggered the current shutoff
+        self.shutoff_started = None # Time of the first leak trigger
+        self.shutoff_attempts = 0 # turn_off calls made for the current shutoff
+        self.shutoff_handle = None # Delay or confirmation timer
+        self.shutoff_latency = None # Seconds from leak trigger to valve off, last shutoff
+
+        # Notifications are queued and sent from a timer, so callbacks don't wait on the notify service
+        self.notifications = notify_queue.NotificationQueue(self,
+            window=float(self.args.get("notify_window", 5)),
+            interval=float(self.args.get("notify_interval", 15)),
+            immediate=["Smoke Alarm", "Carbon Monoxide Alarm", "Water Alarm", "Alarm"]) # "Alarm" is the first intrusion trigger
 
         self.alarm_state_entity = "binary_sensor.{0}_alarm_state".format(self.system_name.lower())
         self.arm_state_entity = "sensor.{0}_arming_state".format(self.system_name.lower())
+        self.water_state_entity = "sensor.{0}_water_shutoff".format(self.system_name.lower())
+
+        # Structured event history, recent events in memory and everything in segment files (see security_journal.py)
+        if "journal_dir" in self.args:
+            journal_dir = self.args["journal_dir"]
+        else:
+            journal_dir = os.path.join(self.config_dir, "security_journal")
+        self.journal = security_journal.Journal(journal_dir,
+            memory=int(self.args.get("journal_memory", 1000)),
+            segment_bytes=int(self.args.get("journal_segment_bytes", 1000000)),
+            segments=int(self.args.get("journal_segments", 10)))
+
+        if "journal_endpoint" in self.args:
+            endpoint = self.args["journal_endpoint"]
+        else:
+            endpoint = self.system_name.lower() + "_journal"
+        self.journal_handle = None
+        if endpoint:
+            self.journal_handle = self.register_endpoint(self.journal_endpoint, endpoint)
         
         # Parse ignored sensor list
         if "ignored_sensors" in self.args:
-            self.ignored_sensors = self.args["ignored_sensors"]
+            ignored = self.args["ignored_sensors"]
+            if type(ignored) == str:
+                ignored = [ignored]
+            self.ignored_sensors = frozenset(ignored)
         else:
-            self.ignored_sensors = []
-
-        devices = self.get_state() #Get Device List from HA
+            self.ignored_sensors = frozenset()
 
         self.motion_sensors = {}
         self.door_sensors = {}
         self.leak_sensors = {}
         self.tamper_sensors = {}
-        
-        self.monitored_devices = [] #List for display to user
-
-        for device in devices:
-            if ("attributes" in devices[device]) and (device not in self.ignored_sensors):
-                if "device_class" in devices[device]["attributes"]:
-                    if devices[device]["attributes"]["device_class"] == "motion" and not device in self.ignored_sensors:
-                        details = {"entity_id": device, "friendly_name": devices[device]["attributes"]["friendly_name"]}
-                        self.motion_sensors[device] = details
-                        self.debuglog("Added Motion {1}".format(details["friendly_name"], device))
-                        self.monitored_devices.insert(0, details["friendly_name"])
-                    if devices[device]["attributes"]["device_class"] == "door" and not device in self.ignored_sensors:
-                        details = {"entity_id": device, "friendly_name": devices[device]["attributes"]["friendly_name"]}
-                        self.door_sensors[device] = details
-                        self.debuglog("Added Door {1}".format(details["friendly_name"], device))
-                        self.monitored_devices.insert(0, details["friendly_name"])
-                    if devices[device]["attributes"]["device_class"] == "tamper" and not device in self.ignored_sensors:
-                        details = {"entity_id": device, "friendly_name": devices[device]["attributes"]["friendly_name"]}
-                        self.tamper_sensors[device] = details
-                        self.debuglog("Added Tamper Sensor {1}".format(details["friendly_name"], device))
-                        self.monitored_devices.insert(0, details["friendly_name"])
-                    if devices[device]["attributes"]["device_class"] == "moisture" and not device in self.ignored_sensors:
-                        details = {"entity_id": device, "friendly_name": devices[device]["attributes"]["friendly_name"]}
-                        self.leak_sensors[device] = details
-                        self.debuglog("Added Leak Sensor {1}".format(details["friendly_name"], device))
-                        self.monitored_devices.insert(0, details["friendly_name"])
-                    if devices[device]["attributes"]["device_class"] == "smoke" and not device in self.ignored_sensors:
-                        details = {"entity_id": device, "friendly_name": devices[device]["attributes"]["friendly_name"]}
-                        self.debuglog("Found Smoke Alarm {1}".format(details["friendly_name"], device))
-                        self.monitored_devices.insert(0, details["friendly_name"])
-                        self.listen_state(self.smoke_callback, entity_id=device)
-                    if devices[device]["attributes"]["device_class"] == "carbon_monoxide" and not device in self.ignored_sensors:
-                        details = {"entity_id": device, "friendly_name": devices[device]["attributes"]["friendly_name"]}
-                        self.debuglog("Found Carbon Monoxide Alarm {1}".format(details["friendly_name"], device))
-                        self.monitored_devices.insert(0, details["friendly_name"])
-                        self.listen_state(self.co_callback, entity_id=device)
-
-        for door in self.door_sensors:
-            self.listen_state(self.door_callback, entity_id=door, new="on")
-        for motion in self.motion_sensors:
-            self.listen_state(self.motion_callback, entity_id=motion, new="on")
-        for leak in self.leak_sensors:
-            self.listen_state(self.leak_callback, entity_id=leak)
-        for tamper in self.tamper_sensors:
-            self.listen_state(self.tamper_callback, entity_id=tamper)
+        self.smoke_sensors = {}
+        self.co_sensors = {}
+        self.sensor_classes = {} # entity -> device_class it is registered as
+        self.open_doors = set() # Door sensors that are on, seeded from the entity index and kept current by door_changed
+        self.monitored_devices = {} # entity -> friendly name, for display to user
+
+        # Motion listeners are only attached while the arm state needs them, see update_listeners. Door listeners
+        # stay attached to keep open_doors current
+        self.door_handles = {}
+        self.motion_handles = {}
+        self.alarm_handles = {} # Leak, tamper, smoke and CO listeners, always attached
+        self.arm_state = None
+        self.sensor_lock = threading.RLock() # Sensors can be added by the entity index listener while a callback runs
+
+        # Get the supported sensor types from the shared device list (see entity_index.py)
+        self.index = entity_index.attach(self)
+        for device_class in SENSOR_TYPES:
+            for device in self.index.by_device_class(device_class):
+                self.add_sensor(device, self.index.get(device))
+        self.index.add_listener(self, self.sensor_changed, match=is_sensor_change) # Classify sensors that show up or change device class later
 
         self.listen_state(self.arm_target_callback, entity_id=self.arm_target_entity)
 
         # Init Arm and Alarm States
         self.update_alarm_state("off")
+        if self.water_shutoff_entity:
+            self.set_shutoff_state("idle")
         self.update_arm_state(self.get_state(self.arm_target_entity)) # Set arm state to what the arm target state currently is
 
+    def terminate(self):
+        # initialize may have stopped early on a missing arg
+        if hasattr(self, "notifications"):
+            self.notifications.flush_all()
+        if getattr(self, "journal_handle", None) is not None:
+            self.unregister_endpoint(self.journal_handle)
+        if hasattr(self, "journal"):
+            self.journal.close()
+        entity_index.detach(self)
+        self.stop_recorder()
+
+    #
+    # Sensor registry
+    #
+
+    def add_sensor(self, entity, state):
+        device_class = entity_index.device_class_of(state)
+        if not device_class in SENSOR_TYPES or entity in self.ignored_sensors:
+            return
+        registry, handles, label, callback, modes, new_filter = SENSOR_TYPES[device_class]
+        details = {"entity_id": entity, "friendly_name": state["attributes"].get("friendly_name", entity)}
+
+        with self.sensor_lock:
+            getattr(self, registry)[entity] = details
+            self.sensor_classes[entity] = device_class
+            self.monitored_devices[entity] = details["friendly_name"]
+            if device_class == "door" and state["state"] == "on":
+                self.open_doors.add(entity)
+            if modes is None or self.arm_state in modes:
+                self.attach_listeners(getattr(self, handles), [entity], getattr(self, callback), new_filter)
+        self.debuglog("Added {0} {1}".format(label, entity))
+
+    def remove_sensor(self, entity):
+        with self.sensor_lock:
+            device_class = self.sensor_classes.pop(entity, None)
+            if device_class is None:
+                return
+            registry, handles, label, callback, modes, new_filter = SENSOR_TYPES[device_class]
+            getattr(self, registry).pop(entity, None)
+            self.monitored_devices.pop(entity, None)
+            self.open_doors.discard(entity)
+            handle = getattr(self, handles).pop(entity, None)
+            if handle is not None:
+                self.cancel_listen_state(handle)
+        self.debuglog("Removed {0} {1}".format(label, entity))
+
+    def sensor_changed(self, entity, old_state, new_state):
+        # Entity index listener, runs on this app's thread for changes is_sensor_change lets through
+        device_class = entity_index.device_class_of(new_state)
+        registered = self.sensor_classes.get(entity)
+        if device_class == registered or (registered is None and not device_class in SENSOR_TYPES):
+            return
+        if entity in self.ignored_sensors:
+            return
+        if registered is not None:
+            self.log("Sensor {0} changed from {1} to {2}".format(entity, registered, device_class))
+            self.remove_sensor(entity)
+        elif device_class in SENSOR_TYPES:
+            self.log("Found new sensor: {0} ({1})".format(entity, device_class))
+        if device_class in SENSOR_TYPES:
+            self.add_sensor(entity, new_state)
+
     #
     # Event Callback Handlers
     #
 
     def smoke_callback(self, entity, attribute, old, new, kwargs):
-        friendly_name = self.get_state(entity, attribute="friendly_name", default=entity)
+        friendly_name = self.index.get_state(entity, attribute="friendly_name", default=entity)
         if new == "on":
             msg = "Smoke Detected on: {0}".format(friendly_name)
+            self.journal_event("trigger", entity, new, msg)
             self.send_notification(msg, type="Smoke Alarm")
         if old == "on" and new == "off":
             msg = "Smoke Cleared on: {0}".format(friendly_name)
+            self.journal_event("clear", entity, new, msg)
             self.send_notification(msg, type="Smoke Alarm")
 
     def co_callback(self, entity, attribute, old, new, kwargs):
-        friendly_name = self.get_state(entity, attribute="friendly_name", default=entity)
+        friendly_name = self.index.get_state(entity, attribute="friendly_name", default=entity)
         if new == "on":
             msg = "CO Detected on: {0}".format(friendly_name)
+            self.journal_event("trigger", entity, new, msg)
             self.send_notification(msg, type="Carbon Monoxide Alarm")
         if old == "on" and new == "off":
             msg = "CO Cleared on: {0}".format(friendly_name)
+            self.journal_event("clear", entity, new, msg)
             self.send_notification(msg, type="Carbon Monoxide Alarm")
 
     def leak_callback(self, entity, attribute, old, new, kwargs):
-        friendly_name = self.leak_sensors[entity]["friendly_name"]
+        friendly_name = self.monitored_devices.get(entity, entity)
         if new == "on":
             msg = "Triggered: {0}".format(friendly_name)
+            self.journal_event("trigger", entity, new, msg)
             self.send_notification(msg, type="Water Alarm")
             if self.water_shutoff_entity:
                 self.handle_water_valve_start(entity)
         if old == "on" and new == "off":
             msg = "Cleared: {0}".format(friendly_name)
+            self.journal_event("clear", entity, new, msg)
             self.send_notification(msg, type="Water Alert")
     
     def valve_state_callback(self, entity, attribute, old, new, kwargs):
@@ -160,58 +297,153 @@ class ASM(hass.Hass):
         # Send a warning if the water valve looses connection
         if new == "unavailable":
             msg = "Water Valve {0} is now unavailable".format(self.water_shutoff_entity)
+            self.journal_event("valve", entity, new, msg)
             self.send_notification(msg, type="System Monitoring")
         
         if old == "unavailable" and (new == "on" or new == "off"):
             msg = "Water Valve {0} no longer unavailable, now {1}".format(self.water_shutoff_entity, new)
+            self.journal_event("valve", entity, new, msg)
             self.send_notification(msg, type="System Monitoring")
-    
+
+        self.water_valve_changed(new)
+
+    #
+    # Water shutoff state machine
+    #
+
     def handle_water_valve_start(self, triggerentity):
-        self.send_notification("Scheduling water shutoff in 1 minute in response to water alarm", type="Automatic Shutoff")
-        self.shutoff_timer = self.run_in(self.handle_water_valve_finish, 60, triggerentity=triggerentity)
+        # Leak trigger. Only the first one starts a shutoff, the rest join it
+        if self.shutoff_state != "idle":
+            if not triggerentity in self.shutoff_triggers:
+                self.shutoff_triggers.add(triggerentity)
+                self.debuglog("{0} joined the {1} water shutoff".format(triggerentity, self.shutoff_state))
+            return
+
+        self.shutoff_triggers = {triggerentity}
+        self.shutoff_started = self.get_now_ts()
+        self.shutoff_attempts = 0
+        if self.shutoff_delay <= 0:
+            self.close_water_valve()
+            return
+
+        self.send_notification("Scheduling water shutoff in {0:g} seconds in response to water alarm".format(self.shutoff_delay), type="Automatic Shutoff")
+        self.set_shutoff_state("pending")
+        self.shutoff_handle = self.run_in(self.handle_water_valve_finish, self.shutoff_delay)
 
     def handle_water_valve_finish(self, kwargs):
-        # Check if leak alarm is still active
-        leakstate = self.get_state(kwargs['triggerentity'])
-        if leakstate == "on":
-            self.send_notification("Shutting off water now", type="Automatic Shutoff")
-            self.turn_off(self.water_shutoff_entity)
+        # End of the delay, shut off if any of the leak sensors is still active
+        self.shutoff_handle = None
+        if self.shutoff_state != "pending":
+            return
+        if any(self.index.get_state(e) == "on" for e in self.shutoff_triggers):
+            self.close_water_valve()
         else:
             self.send_notification("Leak Sensor is no longer active, leaving water on", type="Automatic Shutoff")
+            self.set_shutoff_state("idle")
+
+    def close_water_valve(self):
+        if self.shutoff_attempts == 0 and self.index.get_state(self.water_shutoff_entity) == "off":
+            # No state change will come from the valve
+            self.send_notification("Water is already shut off", type="Automatic Shutoff")
+            self.set_shutoff_state("closed")
+            return
+
+        self.shutoff_attempts += 1
+        if self.shutoff_attempts == 1:
+            self.send_notification("Shutting off water now", type="Automatic Shutoff")
+        self.turn_off(self.water_shutoff_entity)
+        self.set_shutoff_state("closing")
+        self.shutoff_handle = self.run_in(self.water_confirm_callback, self.shutoff_confirm)
+
+    def water_confirm_callback(self, kwargs):
+        # The valve didn't report off in time
+        self.shutoff_handle = None
+        if self.shutoff_state != "closing":
+            return
+        if self.shutoff_attempts <= self.shutoff_retries:
+            self.send_notification("Water valve {0} didn't close within {1:g} seconds, retrying".format(self.water_shutoff_entity, self.shutoff_confirm), type="Automatic Shutoff")
+            self.close_water_valve()
+        else:
+            msg = "Water valve {0} is still open after {1} attempts, shut off the water manually".format(self.water_shutoff_entity, self.shutoff_attempts)
+            self.send_notification(msg, type="Water Alarm")
+            self.set_shutoff_state("failed")
+
+    def water_valve_changed(self, new):
+        if new == "off" and self.shutoff_state in ("pending", "closing", "failed"):
+            # Closed, by this app or by hand
+            if self.shutoff_handle is not None:
+                self.cancel_timer(self.shutoff_handle)
+                self.shutoff_handle = None
+            self.shutoff_latency = round(self.get_now_ts() - self.shutoff_started, 1)
+            self.log("Water valve closed {0} seconds after the leak was detected".format(self.shutoff_latency))
+            self.send_notification("Water is shut off", type="Automatic Shutoff")
+            self.set_shutoff_state("closed")
+        elif new == "on" and self.shutoff_state == "closed":
+            self.set_shutoff_state("idle")
+
+    def set_shutoff_state(self, state):
+        self.shutoff_state = state
+        if state == "idle":
+            self.shutoff_triggers = set()
+        attributes = {"source": "AppDaemon: security.py", "icon": "mdi:water-pump-off" if state == "closed" else "mdi:water-pump",
+                      "friendly_name": self.system_name + " Water Shutoff", "valve": self.water_shutoff_entity,
+                      "triggers": sorted(self.shutoff_triggers), "attempts": self.shutoff_attempts, "last_latency": self.shutoff_latency}
+        self.set_state(self.water_state_entity, state=state, attributes=attributes)
+        if state != "idle" or self.shutoff_started is not None:
+            self.journal_event("shutoff", self.water_shutoff_entity, state, "Water shutoff " + state)
 
 
     def tamper_callback(self, entity, attribute, old, new, kwargs):
-        friendly_name = self.tamper_sensors[entity]["friendly_name"]
+        friendly_name = self.monitored_devices.get(entity, entity)
         if new == "on" and old == "off":
             msg = "Tampering detected on: {0}".format(friendly_name)
+            self.journal_event("trigger", entity, new, msg)
             self.send_notification(msg, type="Tamper Alarm")
         if old == "on" and new == "off":
             msg = "Tampering cleared on: {0}".format(friendly_name)
+            self.journal_event("clear", entity, new, msg)
             self.send_notification(msg, type="Tamper Alert")
     
     def arm_target_callback(self, entity, attribute, old, new, kwargs):
         self.update_arm_state(new)
 
     def motion_callback(self, entity, attribute, old, new, kwargs):
-        details = self.motion_sensors[entity]
+        details = self.motion_sensors.get(entity)
+        if details is None:
+            return # Removed while the callback was on its way
         if self.arm_state == "armed_away":
             self.trigger_alarm("motion", entity, details)
     
     def door_callback(self, entity, attribute, old, new, kwargs):
-        details = self.door_sensors[entity]
+        # Door listeners stay attached while disarmed to keep open_doors current, only armed states trigger
+        details = self.door_sensors.get(entity)
+        if details is None:
+            return
+        self.door_changed(entity, new)
+        if new != "on":
+            return # Closed
         if self.arm_state == "armed_away":
             self.trigger_alarm("door", entity, details)
         if self.arm_state == "armed_home":
             self.trigger_alarm("door", entity, details)
 
+    def door_changed(self, entity, new):
+        # find_open_doors reads the set under the same lock
+        with self.sensor_lock:
+            if new == "on":
+                self.open_doors.add(entity)
+            else:
+                self.open_doors.discard(entity)
+
     def trigger_alarm(self, stype, entity, entity_details):
+        self.journal_event("trigger", entity, "on", "Triggered: " + entity_details["friendly_name"])
         if self.alarm_state == "off": # New alarm since being armed
             self.update_alarm_state("on") # Set system alarm state to on
             message = "Triggered: {sensor} \nAlarm State: {arm_state}".format(sensor=entity_details["friendly_name"], arm_state=self.arm_state)
-            self.send_notification(message, "Alarm")
+            self.send_notification(message, "Alarm") # Sent right away, not queued
         else: # Alarm already triggered
             message = "Triggered: " + entity_details["friendly_name"]
-            self.send_notification(message, "Alert")
+            self.send_notification(message, "Alert", summary=("Triggered", entity_details["friendly_name"]))
 
     def update_alarm_state(self, new):
         if new == "off":
@@ -224,6 +456,7 @@ class ASM(hass.Hass):
 
         attributes = {"source": "AppDaemon: security.py", "icon": icon, "friendly_name": self.system_name + " Alarm State", "device_class": "safety"} 
         self.alarm_state = new
+        self.journal_event("alarm", None, new, "Alarm state " + new)
         self.set_state(self.alarm_state_entity, state=new, attributes=attributes)
     
     def update_arm_state(self, new):
@@ -238,8 +471,9 @@ class ASM(hass.Hass):
             icon = "mdi:lock"
             self.find_open_doors()
 
-        attributes = {"source": "AppDaemon: security.py", "version": __version__, "icon": icon, "friendly_name": self.system_name + " Arm State", "Monitored Devices": self.monitored_devices } 
-        self.arm_state = new
+        attributes = {"source": "AppDaemon: security.py", "version": __version__, "icon": icon, "friendly_name": self.system_name + " Arm State", "Monitored Devices": list(self.monitored_devices.values()) } 
+        self.update_listeners(new)
+        self.journal_event("arm", None, new, "Arm state " + str(new))
         self.set_state(self.arm_state_entity, state=new, attributes=attributes)
 
         # Clear alarm when disarmed
@@ -247,21 +481,102 @@ class ASM(hass.Hass):
             self.send_notification("Disarmed during active alarm, clearing alarm", "Alert")
             self.update_alarm_state("off")
     
+    def update_listeners(self, new):
+        # Motion is watched in armed_away only, nothing while disarmed (doors are always watched, see door_callback)
+        # New listeners are attached before the arm state changes and old ones removed after,
+        # so nothing is missed while switching modes
+        armed = [t for t in SENSOR_TYPES.values() if t[4] is not None]
+        with self.sensor_lock:
+            for registry, handles, label, callback, modes, new_filter in armed:
+                if new in modes:
+                    self.attach_listeners(getattr(self, handles), getattr(self, registry), getattr(self, callback), new_filter)
+
+            self.arm_state = new
+
+            for registry, handles, label, callback, modes, new_filter in armed:
+                if not new in modes:
+                    self.detach_listeners(getattr(self, handles))
+
+    def attach_listeners(self, handles, sensors, callback, new=None):
+        # new: only call back for changes to this state, None for every change
+        if new is None:
+            filters = {}
+        else:
+            filters = {"new": new}
+        for sensor in sensors:
+            if not sensor in handles:
+                handles[sensor] = self.listen_state(callback, entity_id=sensor, **filters)
+
+    def detach_listeners(self, handles):
+        for handle in handles.values():
+            self.cancel_listen_state(handle)
+        handles.clear()
+
     def find_open_doors(self):
-        #Check for any doors that are already opening when arming
-        for door in self.door_sensors:
-            state = self.get_state(door)
-            if state == "on":
-                self.send_notification("Found door {} open while arming".format(self.door_sensors[door]["friendly_name"]), "Warning")
+        #Check for any doors that are already open when arming, one warning for all of them
+        with self.sensor_lock:
+            doors = sorted(self.open_doors)
+        names = []
+        for door in doors:
+            names.append(self.monitored_devices.get(door, door))
+            self.journal_event("open_at_arming", door, "on", "Open while arming: " + names[-1])
+        names.sort()
+        if len(names) == 1:
+            self.send_notification("Found door {} open while arming".format(names[0]), "Warning")
+        elif names:
+            self.send_notification("Found {0} doors open while arming: {1}".format(len(names), ", ".join(names)), "Warning")
 
 
-    def send_notification(self, message, type):
+    #
+    # Journal
+    #
+
+    def journal_event(self, type, sensor, state, message):
+        event = {"time": self.get_now_ts(), "type": type, "sensor": sensor, "state": state, "message": message}
+        if sensor is not None and sensor in self.sensor_classes:
+            event["device_class"] = self.sensor_classes[sensor]
+        async_actions.blocking(self.journal.add, event) # File append, off the event loop in AsyncASM
+
+    async def journal_endpoint(self, request, kwargs):
+        # register_endpoint handler, takes the query from the JSON body or the query string
+        params = dict(request.query)
+        if request.can_read_body:
+            try:
+                params.update(await request.json())
+            except ValueError:
+                return {"error": "The request body isn't JSON"}, 400
+        now = await async_actions.resolve(self.get_now_ts())
+        try:
+            query = security_journal.parse_query(params, now)
+            events = await async_actions.in_executor(self.journal.query, **query) # May read segment files
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return {"events": events, "count": len(events)}, 200
+
+    def send_notification(self, message, type, summary=None):
         title = "[{0} {1}]".format(self.system_name, type)
         self.log(title + " " + message)
-        self.notify(message + "\n", title=title, name=self.notify_target)
+        self.notifications.send(self.notify_target, title, message, summary=summary, type=type)
 
     def debuglog(self, message):
         if self.debug:
             self.log(message)
 
     
+
+
+def is_sensor_change(entity, old_state, new_state):
+    # Entity index filter for sensor_changed: a supported sensor showing up, going away or changing device class.
+    # Runs on the index owner's thread, so it only looks at its arguments
+    old_class = entity_index.device_class_of(old_state)
+    new_class = entity_index.device_class_of(new_state)
+    if old_class == new_class:
+        return False
+    return old_class in SENSOR_TYPES or new_class in SENSOR_TYPES
+
+
+class AsyncASM(async_actions.AsyncActions, ASM):
+    def initialize(self):
+        self.setup_async("smoke_callback", "co_callback", "leak_callback", "valve_state_callback", "tamper_callback",
+            "arm_target_callback", "motion_callback", "door_callback", "handle_water_valve_finish", "water_confirm_callback")
+        super().initialize()
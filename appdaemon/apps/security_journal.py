@@ -0,0 +1,281 @@
+import bisect
+import collections
+import datetime
+import functools
+import json
+import os
+import threading
+
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/security_journal.py
+#
+# Security event journal
+#
+# Keeps structured security events ({"time", "type", "sensor", "state", "message"}) so questions like
+# "what fired between 02:00 and 02:05" can be answered without grepping logs.
+#
+# The newest `memory` events are kept in a ring buffer, queries that only reach back that far never touch
+# the disk. Every event is also appended as a JSON line to a segment file in `directory`. A segment is closed
+# at `segment_bytes` and a new one started, only the newest `segments` files are kept.
+#
+# Each segment has two indexes, built while appending and rebuilt from the file on startup:
+#   time index   - the time and file offset of every INDEX_EVERY-th event, a time range query seeks to the
+#                  closest indexed event before the start and reads forward until the end
+#   sensor index - sensor -> times and file offsets of its events, a sensor query reads only those lines
+#
+# Memory use is bounded by `memory` events plus the indexes of at most `segments` segments of at most
+# `segment_bytes` each, however long the journal runs. Event times have to be added in order.
+#
+# A query returns the newest `limit` matching events, oldest first. The lock is only held to copy the ring buffer
+# or note which parts of which files to read, the files are read after it is released so add() doesn't wait on them.
+#
+# Usage:
+#   import security_journal
+#
+#   self.journal = security_journal.Journal(os.path.join(self.config_dir, "security_journal"))
+#   self.journal.add({"time": self.get_now_ts(), "type": "trigger", "sensor": entity, "state": "on", "message": msg})
+#   self.journal.query(start=ts - 300, end=ts, sensor="binary_sensor.back_door", type="trigger", limit=100)
+#   self.journal.close() # In terminate
+#
+# This module is not an app, it does not need an entry in apps.yaml.
+
+INDEX_EVERY = 32 # Events between time index entries
+MAX_LIMIT = 1000 # Most events a query returns
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+
+
+class Journal:
+    def __init__(self, directory, memory=1000, segment_bytes=1000000, segments=10):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max(int(segments), 1)
+        self.lock = threading.Lock()
+        self.recent = collections.deque(maxlen=max(int(memory), 1)) # Newest events, oldest first
+        self.dropped = 0 # Events that fell out of the ring buffer, older ones have to come from disk
+
+        os.makedirs(directory, exist_ok=True)
+        self.segments = [] # Oldest first, the last one is appended to
+        for name in sorted(os.listdir(directory)):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                self.segments.append(Segment.load(os.path.join(directory, name)))
+        self.next_number = 1
+        if self.segments:
+            self.next_number = segment_number(self.segments[-1].path) + 1
+            self.dropped = 1 # Everything on disk is older than the (empty) ring buffer
+
+    def add(self, event):
+        line = (json.dumps(event, separators=(",", ":"), default=str) + "\n").encode()
+        with self.lock:
+            if len(self.recent) == self.recent.maxlen:
+                self.dropped += 1
+            self.recent.append(event)
+
+            if not self.segments or self.segments[-1].size >= self.segment_bytes:
+                self.rotate()
+            self.segments[-1].append(event, line)
+
+    def rotate(self):
+        # Called with the lock held
+        if self.segments:
+            self.segments[-1].close()
+        path = os.path.join(self.directory, "{0}{1:06d}{2}".format(SEGMENT_PREFIX, self.next_number, SEGMENT_SUFFIX))
+        self.next_number += 1
+        self.segments.append(Segment(path))
+        while len(self.segments) > self.max_segments:
+            old = self.segments.pop(0)
+            try:
+                os.remove(old.path)
+            except FileNotFoundError:
+                pass
+
+    def query(self, start=None, end=None, sensor=None, type=None, limit=100):
+        # The newest `limit` events with start <= time < end, matching sensor and type when given, oldest first
+        limit = min(int(limit), MAX_LIMIT)
+        with self.lock:
+            if self.in_memory(start):
+                events = reversed(list(self.recent))
+            else:
+                events = newest_first(self.segment_reads(start, end, sensor))
+
+        result = []
+        for event in events:
+            if end is not None and event["time"] >= end:
+                continue
+            if start is not None and event["time"] < start:
+                break
+            if sensor is not None and event.get("sensor") != sensor:
+                continue
+            if type is not None and event.get("type") != type:
+                continue
+            result.append(event)
+            if len(result) >= limit:
+                break
+        result.reverse()
+        return result
+
+    def in_memory(self, start):
+        # True if every event at or after start is still in the ring buffer
+        if not self.dropped:
+            return True
+        return start is not None and bool(self.recent) and start > self.recent[0]["time"]
+
+    def segment_reads(self, start, end, sensor):
+        # Called with the lock held. One read per segment overlapping the range, oldest first, run after the
+        # lock is released
+        reads = []
+        for segment in self.segments:
+            if segment.count == 0:
+                continue
+            if start is not None and segment.last < start:
+                continue
+            if end is not None and segment.first >= end:
+                break
+            if sensor is not None:
+                reads.append(segment.sensor_read(sensor, start))
+            else:
+                reads.append(segment.range_read(start))
+        return reads
+
+    def close(self):
+        with self.lock:
+            if self.segments:
+                self.segments[-1].close()
+
+
+class Segment:
+    def __init__(self, path):
+        self.path = path
+        self.file = None # Open for appending while this is the newest segment
+        self.size = 0
+        self.count = 0
+        self.first = None # Time of the first and last event
+        self.last = None
+        self.times = [] # Time index, every INDEX_EVERY-th event
+        self.offsets = []
+        self.sensors = {} # sensor -> ([times], [offsets])
+
+    @classmethod
+    def load(cls, path):
+        segment = cls(path)
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break # Partly written last line
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break
+                segment.index(event, offset)
+                offset += len(line)
+        segment.size = offset
+        return segment
+
+    def append(self, event, line):
+        if self.file is None:
+            self.file = open(self.path, "ab")
+            self.file.truncate(self.size) # Drops a partly written line left by a crash
+        self.file.write(line)
+        self.file.flush()
+        self.index(event, self.size)
+        self.size += len(line)
+
+    def index(self, event, offset):
+        ts = event["time"]
+        if self.count % INDEX_EVERY == 0:
+            self.times.append(ts)
+            self.offsets.append(offset)
+        sensor = event.get("sensor")
+        if sensor is not None:
+            times, offsets = self.sensors.setdefault(sensor, ([], []))
+            times.append(ts)
+            offsets.append(offset)
+        if self.first is None:
+            self.first = ts
+        self.last = ts
+        self.count += 1
+
+    def range_read(self, start):
+        # Events from the last indexed one before start to the current end of the segment
+        offset = 0
+        if start is not None:
+            i = bisect.bisect_left(self.times, start) - 1
+            if i >= 0:
+                offset = self.offsets[i]
+        return functools.partial(read_range, self.path, offset, self.size)
+
+    def sensor_read(self, sensor, start):
+        times, offsets = self.sensors.get(sensor, ((), ()))
+        first = 0 if start is None else bisect.bisect_left(times, start)
+        return functools.partial(read_lines, self.path, offsets[first:]) # Copy, the index grows while it is read
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def newest_first(reads):
+    # Runs the reads of segment_reads from the newest segment back, so a query can stop once it has enough events
+    for read in reversed(reads):
+        yield from reversed(read())
+
+
+def read_range(path, offset, size):
+    # Only up to the size the segment had when the query started, later lines may still be partly written
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+    except FileNotFoundError:
+        return [] # Rotated out since the query started
+    return [json.loads(line) for line in data.splitlines()]
+
+
+def read_lines(path, offsets):
+    events = []
+    try:
+        with open(path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                events.append(json.loads(f.readline()))
+    except FileNotFoundError:
+        pass
+    return events
+
+
+def segment_number(path):
+    return int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def parse_query(params, now):
+    # Query arguments from an HTTP request (query string or JSON body), raises ValueError on bad values
+    query = {}
+    for key in ("start", "end"):
+        if params.get(key) not in (None, ""):
+            query[key] = parse_time(params[key])
+    if "minutes" in params: # Last N minutes, instead of start
+        query["start"] = now - float(params["minutes"]) * 60
+    for key in ("sensor", "type"):
+        if params.get(key):
+            query[key] = str(params[key])
+    if "limit" in params:
+        query["limit"] = int(params["limit"])
+        if query["limit"] < 1:
+            raise ValueError("limit has to be at least 1")
+    return query
+
+
+def parse_time(value):
+    # Seconds since the epoch, or an ISO date and time (local time unless it has an offset)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        raise ValueError("Can't read time {0!r}, use seconds since the epoch or 2026-01-31T02:00:00".format(value))
@@ -0,0 +1,86 @@
+import threading
+
+__version__ = "2026-10-18"
+
+#
+# source: https://github.com/SuPeRMiNoR2/ha-configs/blob/main/appdaemon/apps/state_cache.py
+#
+# Read-through state cache
+#
+# Holds the current state of entities an app is already subscribed to (condition entities and similar),
+# so the motion callbacks don't need a get_state call every time. The app feeds changes in from its
+# existing listen_state callbacks with update(). Anything not cached yet is read from the shared entity index
+# (if the app passed one and the entity is in it) or with get_state, and kept. The async apps rely on the index
+# here, get_state can't be called from their callbacks (see async_actions.py).
+#
+# When the HASS plugin reconnects (plugin_started event) every cached entity is read again, since state
+# changes could have been missed while disconnected.
+#
+# hits and misses count lookups served from the cache and lookups that had to be read. They are published
+# with the app's instrumentation summary (state_cache attribute of sensor.ad_perf_<app name>, see
+# instrumentation.py) when the app has the instrument arg.
+#
+# Usage:
+#   import state_cache
+#
+#   self.states = state_cache.StateCache(self, index=self.index) # index is optional, used to seed values
+#   self.states.track(self.condition_entity)
+#   self.states.get(self.condition_entity)
+#
+#   def condition_callback(self, entity, attribute, old, new, kwargs):
+#       self.states.update(entity, new)
+#
+# This module is not an app, it does not need an entry in apps.yaml.
+
+class StateCache:
+    def __init__(self, app, index=None):
+        self.app = app
+        self.index = index
+        self.lock = threading.Lock()
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+        self.app.listen_event(self.reconnect_callback, "plugin_started")
+        if hasattr(app, "instrument_stats"):
+            app.instrument_stats("state_cache", self.stats)
+
+    def track(self, entity):
+        value = self.read(entity)
+        with self.lock:
+            self.values[entity] = value
+
+    def read(self, entity):
+        # Current value, from the shared entity index if there is one
+        if self.index is not None and entity in self.index:
+            return self.index.get_state(entity)
+        return self.app.get_state(entity)
+
+    def update(self, entity, value):
+        with self.lock:
+            self.values[entity] = value
+
+    def get(self, entity):
+        with self.lock:
+            if entity in self.values:
+                self.hits += 1
+                return self.values[entity]
+            self.misses += 1
+        value = self.read(entity)
+        with self.lock:
+            self.values[entity] = value
+        return value
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entities": len(self.values),
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else None}
+
+    def reconnect_callback(self, event_name, data, kwargs):
+        # Reload everything, changes may have been missed while HA was disconnected
+        with self.lock:
+            entities = list(self.values)
+        for entity in entities:
+            value = self.app.get_state(entity)
+            with self.lock:
+                self.values[entity] = value
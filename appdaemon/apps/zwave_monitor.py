@@ -1,7 +1,14 @@
 import hassapi as hass
+import instrumentation
+import recorder
+import ast
+import collections
 import datetime
+import entity_index
+import async_actions
+import asyncio
 
-__version__ = "2023-01-19"
+__version__ = "2026-10-18"
 
 # Source: 
 #
@@ -11,11 +18,31 @@ __version__ = "2023-01-19"
 # autoping
 # autorefresh
 # time
+# refresh_window: Number of refresh commands sent at once. Defaults to 3
+# refresh_spacing: Seconds to wait between windows. Defaults to 5
+# refresh_retries: Number of times a failed refresh is retried (with back-off). Defaults to 3
+#
+# AppDaemon logs a failed service call and returns instead of raising, so refreshes are sent with return_result
+# and a result with "success": false counts as a failure, the same as an exception.
 #
 # debug
+#
+# Battery refreshes are queued lowest battery first and sent a few at a time so the Z-Wave controller
+# queue doesn't get flooded and normal commands still go through while a refresh is running.
+#
+# class: AsyncMonitor instead of monitor runs the callbacks on AppDaemon's event loop (see async_actions.py).
+# The refreshes of a window are sent concurrently, at most async_limit at a time
+
+# Entities of the Z-Wave JS integration
+ZWAVE_TEMPLATE = "{{ integration_entities('zwave_js') | list }}"
 
-class monitor(hass.Hass):
+
+class monitor(recorder.Recorder, instrumentation.Instrumentation, hass.Hass):
     def initialize(self):
+        # Opt-in callback timing (see instrumentation.py), has to run before any callback is registered
+        self.setup_instrumentation("daily_callback", "refresh_window_callback", "retry_callback")
+        self.setup_recorder() # Opt-in callback and action recording (see recorder.py)
+
         if "debug" in self.args:
             self.debug = True
             self.debuglog("Debug logging enabled")
@@ -42,32 +69,170 @@ class monitor(hass.Hass):
         else:
             self.autorefresh = False
 
-        self.battery_entities = []
+        self.refresh_window = int(self.args.get("refresh_window", 3))
+        self.refresh_spacing = float(self.args.get("refresh_spacing", 5))
+        self.refresh_retries = int(self.args.get("refresh_retries", 3))
+
+        self.battery_entities = set()
+        self.refresh_queue = collections.deque() # Entities waiting to be refreshed
+        self.queued = set() # Same entities, to avoid queueing one twice
+        self.attempts = {} # entity -> failed attempts
+        self.refresh_handle = None # Timer for the next window, None when idle
+        self.index = entity_index.attach(self) # Shared device list, see entity_index.py
 
         self.discover_devices()
 
+    def terminate(self):
+        entity_index.detach(self)
+        self.stop_recorder()
+
     def daily_callback(self, kwargs):
         self.debuglog("Refresh running")
         self.discover_devices()
         self.refresh_batteries()
 
     def discover_devices(self):
-        # Get full entity list from HA
-        entities = self.get_state() 
-        
-        # Find entites that have the "battery" class
-        for entity in entities:
-            try:
-                if entities[entity]["attributes"]["device_class"] == "battery":
-                    self.battery_entities.insert(0, entity)
-            except KeyError:
-                pass
+        self.use_devices(self.zwave_entities())
+
+    def use_devices(self, zwave):
+        # Find entites that have the "battery" class and belong to Z-Wave JS (zwave is None if that is unknown)
+        batteries = set(self.index.by_device_class("battery"))
+        if zwave is not None:
+            batteries &= zwave
+        self.battery_entities = batteries
+        self.debuglog("Found {0} Z-Wave battery entities".format(len(self.battery_entities)))
+
+    def zwave_entities(self):
+        # Ask HA which entities belong to the Z-Wave JS integration, returns None if that isn't available
+        try:
+            return parse_entity_list(self.render_template(ZWAVE_TEMPLATE))
+        except Exception as e:
+            self.log("Couldn't get the Z-Wave entity list, refreshing all battery entities ({0})".format(e))
+            return None
 
     def refresh_batteries(self):
-        for e in self.battery_entities:
-            self.debuglog("Scheduling Refresh for: "+e)
-            self.call_service("zwave_js/refresh_value", entity_id=e)
+        # Queue every battery, lowest level first
+        for e in sorted(self.battery_entities, key=self.battery_level):
+            if not e in self.queued:
+                self.debuglog("Scheduling Refresh for: "+e)
+                self.queued.add(e)
+                self.refresh_queue.append(e)
+        if self.refresh_handle is None:
+            self.refresh_handle = self.run_in(self.refresh_window_callback, 0)
+
+    def battery_level(self, entity):
+        try:
+            return float(self.index.get_state(entity))
+        except (ValueError, TypeError):
+            return 0 # Unknown levels go first
+
+    def refresh_window_callback(self, kwargs):
+        # Sends the next window of refreshes, then waits refresh_spacing before the next one
+        self.refresh_handle = None
+        for entity in self.next_window():
+            self.send_refresh(entity)
+        if self.refresh_queue:
+            self.refresh_handle = self.run_in(self.refresh_window_callback, self.refresh_spacing)
+
+    def next_window(self):
+        # Takes the next refresh_window entities off the queue
+        window = []
+        for i in range(min(self.refresh_window, len(self.refresh_queue))):
+            entity = self.refresh_queue.popleft()
+            self.queued.discard(entity)
+            window.append(entity)
+        return window
+
+    def send_refresh(self, entity):
+        try:
+            error = service_error(self.call_service("zwave_js/refresh_value", entity_id=entity, return_result=True))
+        except Exception as e:
+            error = e
+        if error is None:
+            self.refresh_done(entity)
+        else:
+            delay = self.refresh_failed(entity, error)
+            if delay is not None:
+                self.run_in(self.retry_callback, delay, entity=entity)
+
+    def refresh_done(self, entity):
+        self.attempts.pop(entity, None)
+
+    def refresh_failed(self, entity, e):
+        # Returns the seconds to wait before retrying, None when giving up
+        attempts = self.attempts.get(entity, 0) + 1
+        if attempts > self.refresh_retries:
+            self.log("Giving up refreshing {0} after {1} attempts ({2})".format(entity, attempts, e))
+            self.attempts.pop(entity, None)
+            return None
+        self.attempts[entity] = attempts
+        delay = self.refresh_spacing * (2 ** attempts)
+        self.debuglog("Refresh for {0} failed ({1}), retrying in {2} seconds".format(entity, e, delay))
+        return delay
+
+    def retry_callback(self, kwargs):
+        entity = kwargs["entity"]
+        if not entity in self.queued:
+            self.queued.add(entity)
+            self.refresh_queue.append(entity)
+        if self.refresh_handle is None:
+            self.refresh_handle = self.run_in(self.refresh_window_callback, 0)
 
     def debuglog(self, message):
         if self.debug:
-            self.log(message)
\ No newline at end of file
+            self.log(message)
+
+
+def service_error(result):
+    # Error of a call_service(..., return_result=True) result, None if it worked
+    if isinstance(result, dict) and result.get("success") is False:
+        return result.get("error") or "service call failed"
+    return None
+
+
+def parse_entity_list(result):
+    # render_template returns the list as text
+    if isinstance(result, str):
+        result = ast.literal_eval(result)
+    return set(result)
+
+
+class AsyncMonitor(async_actions.AsyncActions, monitor):
+    def initialize(self):
+        self.setup_async("retry_callback")
+        super().initialize()
+
+    async def daily_callback(self, kwargs):
+        self.debuglog("Refresh running")
+        try:
+            zwave = parse_entity_list(await async_actions.resolve(self.render_template(ZWAVE_TEMPLATE)))
+        except Exception as e:
+            self.log("Couldn't get the Z-Wave entity list, refreshing all battery entities ({0})".format(e))
+            zwave = None
+        self.use_devices(zwave)
+        await self.run_async(self.refresh_batteries)
+
+    async def refresh_window_callback(self, kwargs):
+        # Same as monitor.refresh_window_callback, with the window sent concurrently
+        self.refresh_handle = None
+        semaphore = asyncio.Semaphore(self.async_limit)
+
+        async def send(entity):
+            async with semaphore:
+                await self.send_refresh_async(entity)
+
+        await asyncio.gather(*(send(e) for e in self.next_window()))
+        if self.refresh_queue:
+            self.refresh_handle = await async_actions.resolve(self.run_in(self.refresh_window_callback, self.refresh_spacing))
+
+    async def send_refresh_async(self, entity):
+        try:
+            error = service_error(await async_actions.resolve(self.call_service("zwave_js/refresh_value", entity_id=entity, return_result=True)))
+        except Exception as e:
+            error = e
+        if error is None:
+            self.refresh_done(entity)
+        else:
+            delay = self.refresh_failed(entity, error)
+            if delay is not None:
+                await async_actions.resolve(self.run_in(self.retry_callback, delay, entity=entity))
@@ -0,0 +1,402 @@
+import argparse
+import importlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import fakehass
+
+#
+# Replay benchmark for the apps in ../apps
+#
+# Runs the apps against fakehass.FakeHA with a virtual clock, so hours of events replay in seconds,
+# and reports per app class:
+#   callbacks/s   - callbacks delivered per second of wall time
+#   reads/ev      - get_state calls per injected event
+#   services      - service calls issued (turn_on/turn_off/notify/call_service)
+#   timers        - timers created, and cancels - timers cancelled (timer churn)
+#   dumps         - full state dumps pulled with get_state()
+#
+# Synthetic scenarios:
+#   python bench.py startup --entities 10000     # build all apps against a large state dump
+#   python bench.py pir --rate 2000 --minutes 30 # thousands of PIR triggers per minute
+#   python bench.py humidity --minutes 240       # humidity changes in the bathrooms
+#   python bench.py security --rate 300          # motion/door bursts while armed
+#   python bench.py daily --days 3               # battery reports and Z-Wave refreshes
+#   python bench.py all
+#   python bench.py pir --engine --rooms 200    # MotionLights rooms in one MotionLightsEngine
+#   python bench.py humidity --humidity-engine  # bathroom humidity in one HumidityEngine
+#   python bench.py all --async                 # the async variants of the apps that have one
+#
+# Recorded streams:
+#   python bench.py replay --states states.json --events events.jsonl --apps apps.yaml
+#
+#   states.json  - a state dump in the same layout as get_state() (entity_id -> {state, attributes})
+#   events.jsonl - one {"time": seconds from start, "entity_id": ..., "state": ..., "attributes": {...}} per line
+#   apps.yaml    - AppDaemon app configuration (JSON also works, yaml needs PyYAML)
+
+APPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "apps")
+
+# Async variant of each app class that has one (see apps/async_actions.py)
+ASYNC_CLASSES = {
+    "MotionLights": "AsyncMotionLights",
+    "MotionLightsEngine": "AsyncMotionLightsEngine",
+    "RoomLights": "AsyncRoomLights",
+    "ASM": "AsyncASM",
+    "Battery": "AsyncBattery",
+    "monitor": "AsyncMonitor",
+}
+
+COLUMNS = ["apps", "callbacks", "callbacks/s", "reads", "reads/ev", "dumps", "services", "writes", "timers", "cancels", "errors"]
+
+
+def load_apps():
+    fakehass.install()
+    if not APPS_DIR in sys.path:
+        sys.path.insert(0, APPS_DIR)
+
+
+def app_class(module, cls):
+    return getattr(importlib.import_module(module), cls)
+
+
+#
+# Synthetic world
+#
+
+def build_world(rng, entities=2000, rooms=20, bathrooms=4):
+    # Returns a state dump and an app configuration that covers every app
+    states = {}
+    apps = {}
+
+    states["input_select.light_mode"] = {"state": "Day", "attributes": {"options": ["Day", "Night", "Movie"]}}
+    states["input_boolean.automation"] = {"state": "on", "attributes": {}}
+    states["input_select.alarm_target"] = {"state": "disarmed", "attributes": {"options": ["disarmed", "armed_home", "armed_away"]}}
+    states["person.someone"] = {"state": "home", "attributes": {}}
+    states["sensor.temperature"] = {"state": "74", "attributes": {"device_class": "temperature"}}
+    states["switch.water_valve"] = {"state": "on", "attributes": {}}
+
+    for r in range(rooms):
+        room = "room{0}".format(r)
+        lights = ["light.{0}_{1}".format(room, i) for i in range(4)]
+        for light in lights:
+            states[light] = {"state": "off", "attributes": {"friendly_name": light}}
+        for mode in ["day", "night", "off"]:
+            states["scene.{0}_{1}".format(room, mode)] = {"state": "scening", "attributes": {"entity_id": lights}}
+        motion = "binary_sensor.{0}_motion".format(room)
+        door = "binary_sensor.{0}_door".format(room)
+        states[motion] = {"state": "off", "attributes": {"device_class": "motion", "friendly_name": room + " Motion"}}
+        states[door] = {"state": "off", "attributes": {"device_class": "door", "friendly_name": room + " Door"}}
+        states["sensor.{0}_motion_battery".format(room)] = {"state": str(rng.randint(5, 100)), "attributes": {"device_class": "battery"}}
+        states["fan.{0}".format(room)] = {"state": "off", "attributes": {}}
+
+        apps["lights_" + room] = {"module": "motion_lights", "class": "MotionLights", "sensor": motion,
+                                  "entity_on": lights[0], "brightness_on": 100, "brightness_off": 25,
+                                  "condition": "input_boolean.automation"}
+        apps["room_" + room] = {"module": "motion_lights", "class": "RoomLights", "sensor": [motion],
+                                "roomprefix": room, "lightmodeselect": "input_select.light_mode",
+                                "condition": "input_boolean.automation", "delay": 5}
+        apps["fan_" + room] = {"module": "motion_fans", "class": "MotionFan", "sensor": motion,
+                               "fan": "fan.{0}".format(room), "temperature": "sensor.temperature"}
+
+    # A group as entity_on, turned on and off through homeassistant/turn_on and turn_off
+    group_lights = ["light.room0_{0}".format(i) for i in range(4)]
+    states["group.room0_lights"] = {"state": "off", "attributes": {"entity_id": group_lights}}
+    apps["lights_group"] = {"module": "motion_lights", "class": "MotionLights", "sensor": "binary_sensor.room0_motion",
+                            "entity_on": "group.room0_lights", "condition": "input_boolean.automation"}
+
+    for b in range(bathrooms):
+        bath = "bath{0}".format(b)
+        states["light.{0}".format(bath)] = {"state": "off", "attributes": {}}
+        states["switch.{0}_fan".format(bath)] = {"state": "off", "attributes": {}}
+        states["sensor.{0}_humidity".format(bath)] = {"state": "45", "attributes": {"device_class": "humidity"}}
+        states["binary_sensor.{0}_leak".format(bath)] = {"state": "off", "attributes": {"device_class": "moisture", "friendly_name": bath + " Leak"}}
+        apps["fan_" + bath] = {"module": "bathroom_control", "class": "bathroom_fan_control",
+                               "light": "light.{0}".format(bath), "fan": "switch.{0}_fan".format(bath),
+                               "humidity": "sensor.{0}_humidity".format(bath), "presence": "person.someone", "halogging": True}
+
+    apps["security"] = {"module": "security", "class": "ASM", "arm_target": "input_select.alarm_target",
+                        "notify_target": "phone", "water_shutoff": "switch.water_valve",
+                        "journal_dir": tempfile.mkdtemp(prefix="security_journal")}
+    apps["battery"] = {"module": "battery", "class": "Battery", "notifier": "phone", "history_dir": tempfile.mkdtemp(prefix="battery_history")}
+    apps["zwave"] = {"module": "zwave_monitor", "class": "monitor"}
+
+    # Fill up with unrelated entities
+    classes = ["temperature", "humidity", "power", "energy", "battery", None]
+    i = 0
+    while len(states) < entities:
+        device_class = rng.choice(classes)
+        attributes = {"device_class": device_class} if device_class else {}
+        state = str(rng.randint(0, 100)) if device_class else "unknown"
+        states["sensor.filler_{0}".format(i)] = {"state": state, "attributes": attributes}
+        i += 1
+
+    return states, apps
+
+
+def use_engine(apps):
+    # Replaces the MotionLights apps with one MotionLightsEngine running the same rooms
+    rooms = []
+    for name in [n for n, c in apps.items() if c["class"] == "MotionLights"]:
+        config = apps.pop(name)
+        room = {k: v for k, v in config.items() if not k in ("module", "class")}
+        room["name"] = name
+        rooms.append(room)
+    apps["lights_engine"] = {"module": "motion_lights", "class": "MotionLightsEngine", "rooms": rooms}
+
+
+def use_humidity_engine(apps):
+    # Moves the humidity sensors of the bathroom apps into one HumidityEngine
+    rooms = {}
+    for name, config in apps.items():
+        if config["class"] == "bathroom_fan_control" and "humidity" in config:
+            rooms[name] = config.pop("humidity")
+    apps["humidity_engine"] = {"module": "humidity_engine", "class": "HumidityEngine", "rooms": rooms}
+
+
+def use_async(apps):
+    for config in apps.values():
+        config["class"] = ASYNC_CLASSES.get(config["class"], config["class"])
+
+
+def zwave_entities(states):
+    # The per room batteries are the Z-Wave devices, the filler batteries belong to other integrations
+    return {e for e in states if e.startswith("sensor.room") and e.endswith("_battery")}
+
+
+def start_apps(ha, apps, only=None):
+    for name, config in apps.items():
+        if only and not config["class"] in only:
+            continue
+        args = {k: v for k, v in config.items() if not k in ("module", "class")}
+        ha.create_app(app_class(config["module"], config["class"]), name, args)
+
+
+#
+# Event streams, (seconds from start, entity_id, state, attributes)
+#
+
+def pir_events(rng, states, rate, minutes):
+    sensors = sorted(e for e, s in states.items() if s["attributes"].get("device_class") == "motion")
+    interval = 60.0 / rate
+    t = 0.0
+    while t < minutes * 60:
+        sensor = rng.choice(sensors)
+        yield (t, sensor, "on", None)
+        yield (t + interval / 2, sensor, "off", None)
+        t += interval
+
+
+def humidity_events(rng, states, minutes):
+    sensors = sorted(e for e, s in states.items() if e.endswith("_humidity") and e.startswith("sensor.bath"))
+    levels = {s: 45.0 for s in sensors}
+    t = 0.0
+    while t < minutes * 60:
+        for sensor in sensors:
+            if rng.random() < 0.01:
+                levels[sensor] = 70.0 # Shower
+            elif rng.random() < 0.02:
+                yield (t, sensor, "unavailable", None)
+                continue
+            else:
+                levels[sensor] = max(40.0, levels[sensor] - rng.random())
+            yield (t, sensor, "{0:.1f}".format(levels[sensor]), None)
+        t += 30
+
+
+def security_events(rng, states, rate, minutes):
+    sensors = sorted(e for e, s in states.items() if s["attributes"].get("device_class") in ("motion", "door"))
+    yield (0, "input_select.alarm_target", "armed_away", None)
+    interval = 60.0 / rate
+    t = 1.0
+    while t < minutes * 60:
+        sensor = rng.choice(sensors)
+        yield (t, sensor, "on", None)
+        yield (t + interval / 2, sensor, "off", None)
+        t += interval
+    yield (t, "input_select.alarm_target", "disarmed", None)
+
+
+def battery_events(rng, states, days):
+    sensors = sorted(e for e, s in states.items() if s["attributes"].get("device_class") == "battery")
+    t = 0.0
+    while t < days * 86400:
+        sensor = rng.choice(sensors)
+        yield (t, sensor, str(rng.randint(1, 100)), None)
+        t += 600
+
+
+def replay(ha, events):
+    start = ha.now
+    count = 0
+    for offset, entity, state, attributes in events:
+        ha.run_until(start + offset)
+        ha.set_state(entity, state, attributes)
+        count += 1
+    return count
+
+
+#
+# Report
+#
+
+def report(ha, apps, events, elapsed, title):
+    by_class = {}
+    for name, config in apps.items():
+        if not name in ha.stats:
+            continue
+        row = by_class.setdefault(config["class"], {"apps": 0})
+        row["apps"] += 1
+        for key, value in ha.stats[name].items():
+            row[key] = row.get(key, 0) + value
+
+    errors = {}
+    for name, trace in ha.errors:
+        errors[apps[name]["class"]] = errors.get(apps[name]["class"], 0) + 1
+
+    print("{0}: {1} events in {2:.3f}s".format(title, events, elapsed))
+    widths = [22] + [max(len(c), 9) for c in COLUMNS]
+    print("  ".join(h.rjust(w) for h, w in zip(["class"] + COLUMNS, widths)))
+    for cls in sorted(by_class):
+        row = by_class[cls]
+        values = [cls]
+        for column in COLUMNS:
+            if column == "callbacks/s":
+                value = "{0:.0f}".format(row.get("callbacks", 0) / elapsed) if elapsed else "-"
+            elif column == "reads/ev":
+                value = "{0:.2f}".format(row.get("reads", 0) / events) if events else "-"
+            elif column == "errors":
+                value = errors.get(cls, 0)
+            else:
+                value = row.get(column, 0)
+            values.append(str(value))
+        print("  ".join(v.rjust(w) for v, w in zip(values, widths)))
+
+    if ha.errors:
+        print("\nFirst error ({0} total):".format(len(ha.errors)))
+        print(ha.errors[0][1])
+    print()
+
+
+def run_scenario(name, options):
+    rng = random.Random(options.seed)
+    states, apps = build_world(rng, options.entities, options.rooms, options.bathrooms)
+    if options.engine:
+        use_engine(apps)
+    if options.humidity_engine:
+        use_humidity_engine(apps)
+    if options.use_async:
+        use_async(apps)
+    if options.instrument:
+        for config in apps.values():
+            config["instrument"] = True
+    state_dir = tempfile.mkdtemp(prefix="app_state") # Saved state (see app_state.py) stays out of the bench folder
+    for config in apps.values():
+        config.setdefault("state_dir", state_dir)
+    ha = fakehass.FakeHA(quiet=not options.verbose)
+    ha.load(states)
+    ha.integrations["zwave_js"] = zwave_entities(states)
+
+    started = time.perf_counter()
+    start_apps(ha, apps, options.only)
+    startup = time.perf_counter() - started
+
+    if name == "startup":
+        report(ha, apps, 0, startup, "startup ({0} entities)".format(len(states)))
+        ha.shutdown()
+        return ha
+
+    for app in ha.stats.values():
+        app.clear() # Only report the replay itself
+
+    if name == "pir":
+        events = pir_events(rng, states, options.rate, options.minutes)
+    elif name == "humidity":
+        events = humidity_events(rng, states, options.minutes)
+    elif name == "security":
+        events = security_events(rng, states, options.rate, options.minutes)
+    elif name == "daily":
+        events = battery_events(rng, states, options.days)
+
+    started = time.perf_counter()
+    count = replay(ha, events)
+    ha.advance(3600) # Let the off timers run out
+    elapsed = time.perf_counter() - started
+    report(ha, apps, count, elapsed, name)
+    ha.shutdown()
+    return ha
+
+
+def run_recorded(options):
+    with open(options.states) as f:
+        states = json.load(f)
+    with open(options.apps) as f:
+        if options.apps.endswith(".json"):
+            apps = json.load(f)
+        else:
+            import yaml
+            apps = yaml.safe_load(f)
+    apps = {name: config for name, config in apps.items() if isinstance(config, dict) and "module" in config}
+
+    def events():
+        with open(options.events) as f:
+            for line in f:
+                if line.strip():
+                    e = json.loads(line)
+                    yield (float(e["time"]), e["entity_id"], e.get("state"), e.get("attributes"))
+
+    ha = fakehass.FakeHA(quiet=not options.verbose)
+    ha.load(states)
+    started = time.perf_counter()
+    start_apps(ha, apps, options.only)
+    report(ha, apps, 0, time.perf_counter() - started, "startup")
+
+    for app in ha.stats.values():
+        app.clear()
+    started = time.perf_counter()
+    count = replay(ha, events())
+    elapsed = time.perf_counter() - started
+    report(ha, apps, count, elapsed, "replay")
+    ha.shutdown()
+    return ha
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline replay benchmark for the AppDaemon apps")
+    parser.add_argument("scenario", choices=["startup", "pir", "humidity", "security", "daily", "all", "replay"])
+    parser.add_argument("--entities", type=int, default=2000, help="Size of the synthetic state dump")
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--bathrooms", type=int, default=4)
+    parser.add_argument("--rate", type=int, default=1000, help="Sensor triggers per minute")
+    parser.add_argument("--minutes", type=int, default=30)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--states", help="Recorded state dump (replay)")
+    parser.add_argument("--events", help="Recorded events, JSON lines (replay)")
+    parser.add_argument("--apps", help="App configuration (replay)")
+    parser.add_argument("--engine", action="store_true", help="Run the MotionLights rooms in one MotionLightsEngine")
+    parser.add_argument("--humidity-engine", action="store_true", help="Run the bathroom humidity sensors in one HumidityEngine")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run the async variants of the apps")
+    parser.add_argument("--instrument", action="store_true", help="Turn on the apps' callback instrumentation")
+    parser.add_argument("--only", nargs="+", help="Only start these app classes, for example MotionLights ASM")
+    parser.add_argument("--verbose", action="store_true", help="Print app logs")
+    options = parser.parse_args(argv)
+
+    load_apps()
+
+    if options.scenario == "replay":
+        if not (options.states and options.events and options.apps):
+            parser.error("replay needs --states, --events and --apps")
+        run_recorded(options)
+    elif options.scenario == "all":
+        for name in ["startup", "pir", "humidity", "security", "daily"]:
+            run_scenario(name, options)
+    else:
+        run_scenario(options.scenario, options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,531 @@
+import asyncio
+import collections
+import datetime
+import functools
+import heapq
+import re
+import sys
+import traceback
+
+#
+# Offline stand-in for AppDaemon's hassapi, used by bench.py
+#
+# FakeHA plays the part of both Home Assistant and the AppDaemon scheduler. It holds the entity states,
+# dispatches state/event callbacks and runs timers from a virtual clock, so the apps in ../apps can be
+# driven by synthetic or recorded event streams without a live HA.
+#
+# Every call an app makes is counted per app in FakeHA.stats:
+#   callbacks   - state, event and timer callbacks delivered to the app
+#   reads       - get_state calls (full dumps are also counted in "dumps")
+#   services    - service calls (turn_on/turn_off/notify/call_service)
+#   writes      - set_state calls
+#   timers      - timers created (run_in/run_every/run_daily)
+#   cancels     - timers cancelled
+#   listens     - listen_state/listen_event registrations
+#
+# Callbacks are queued and delivered in order after the current callback returns, like AppDaemon does,
+# instead of being called recursively from inside turn_on/set_state.
+#
+# Async callbacks are run to completion on an event loop. Like AppDaemon, API calls made from the event loop
+# return something to await (an already finished future here) instead of the value.
+#
+# Services in FakeHA.failing fail the way AppDaemon reports it: logged, and {"success": False} with return_result.
+#
+# Endpoints registered with register_endpoint can be called with ha.request(name, body), which returns
+# the (response, status) the app's handler returned.
+#
+# Usage:
+#   ha = fakehass.FakeHA()
+#   fakehass.install()   # makes "import hassapi" return this module
+#   import motion_lights
+#   ha.set_state("light.hall", "off")
+#   app = ha.create_app(motion_lights.MotionLights, "hall", {"sensor": "binary_sensor.hall", "entity_on": "light.hall"})
+#   ha.set_state("binary_sensor.hall", "on")
+#   ha.advance(300)
+
+START = datetime.datetime(2024, 1, 1, 12, 0, 0)
+
+STATE_ACTIONS = ("turn_on", "turn_off", "toggle")
+# Domains that have turn_on/turn_off/toggle services in HA, a call for any other domain (group/turn_on) is an error
+SWITCHABLE_DOMAINS = ("homeassistant", "light", "switch", "fan", "input_boolean", "scene", "script", "automation",
+                      "media_player", "climate")
+
+
+def api(function):
+    # Returns the result as a finished future when called from the event loop, see the header
+    @functools.wraps(function)
+    def call(self, *args, **kwargs):
+        result = function(self, *args, **kwargs)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return result
+        future = loop.create_future()
+        future.set_result(result)
+        return future
+    return call
+
+
+class FakeHA:
+    def __init__(self, start=START, quiet=True):
+        self.now = start.timestamp()
+        self.quiet = quiet
+        self.states = {}
+        self.apps = {}
+        self.state_listeners = collections.defaultdict(list) # entity or domain -> [handle]
+        self.event_listeners = collections.defaultdict(list) # event -> [handle]
+        self.listeners = {} # handle -> listener dict
+        self.timers = [] # heap of (time, seq, handle)
+        self.timer_info = {} # handle -> timer dict
+        self.queue = collections.deque() # callbacks waiting to be delivered
+        self.dispatching = False
+        self.loop = asyncio.new_event_loop() # Runs async callbacks
+        self.seq = 0
+        self.stats = collections.defaultdict(collections.Counter)
+        self.actions = [] # (time, app, service, data)
+        self.integrations = {} # integration -> entity ids, for integration_entities() templates
+        self.endpoints = {} # name -> (app, callback)
+        self.failing = set() # Services that fail, like a call AppDaemon logs as failed
+        self.errors = []
+
+    #
+    # Apps
+    #
+
+    def create_app(self, cls, name, args=None):
+        app = cls.__new__(cls)
+        Hass.__init__(app, self, name, args or {})
+        self.apps[name] = app
+        self.call(app, app.initialize)
+        self.drain()
+        return app
+
+    def remove_app(self, name):
+        app = self.apps.pop(name)
+        if hasattr(app, "terminate"):
+            self.call(app, app.terminate)
+        for handle in [h for h, l in self.listeners.items() if l["app"] is app]:
+            self.cancel_listen(handle)
+        for handle in [h for h, t in self.timer_info.items() if t["app"] is app]:
+            del self.timer_info[handle]
+        self.drain()
+
+    def shutdown(self):
+        for name in list(self.apps):
+            self.remove_app(name)
+
+    def call(self, app, function, *args):
+        try:
+            result = function(*args)
+            if asyncio.iscoroutine(result):
+                self.loop.run_until_complete(result)
+        except Exception:
+            self.errors.append((app.name, traceback.format_exc()))
+
+    def request(self, name, body=None, query=None):
+        # Calls an endpoint like an HTTP request to /api/appdaemon/<name> would
+        if not name in self.endpoints:
+            return {"error": "no endpoint " + name}, 404
+        app, callback = self.endpoints[name]
+        result = callback(Request(body, query), {})
+        if asyncio.iscoroutine(result):
+            result = self.loop.run_until_complete(result)
+        return result
+
+    #
+    # States
+    #
+
+    def load(self, hastate):
+        # Load a state dump in the same layout get_state() returns
+        for entity, state in hastate.items():
+            self.states[entity] = {
+                "entity_id": entity,
+                "state": state.get("state"),
+                "attributes": dict(state.get("attributes", {})),
+                "last_changed": self.iso(),
+            }
+
+    def set_state(self, entity, state=None, attributes=None, replace=False):
+        old = self.states.get(entity)
+        new = {"entity_id": entity, "attributes": {}}
+        if old is not None and not replace:
+            new["attributes"] = dict(old["attributes"])
+            new["state"] = old["state"]
+        if state is not None:
+            new["state"] = state
+        if attributes:
+            new["attributes"].update(attributes)
+        new["last_changed"] = self.iso()
+        self.states[entity] = new
+        self.state_changed(entity, old, new)
+        self.drain()
+
+    def remove_state(self, entity):
+        old = self.states.pop(entity, None)
+        if old is not None:
+            self.state_changed(entity, old, None)
+            self.drain()
+
+    def state_changed(self, entity, old, new):
+        self.fire_event("state_changed", {"entity_id": entity, "old_state": old, "new_state": new})
+
+        domain = entity.split(".", 1)[0]
+        handles = self.state_listeners.get(entity, []) + self.state_listeners.get(domain, [])
+        for handle in handles:
+            l = self.listeners.get(handle)
+            if l is None:
+                continue
+            attribute = l["attribute"]
+            if attribute == "all":
+                o, n = old, new
+            elif attribute is None:
+                o = old["state"] if old else None
+                n = new["state"] if new else None
+                if o == n:
+                    continue
+            else:
+                o = old["attributes"].get(attribute) if old else None
+                n = new["attributes"].get(attribute) if new else None
+                if o == n:
+                    continue
+            if l["new"] is not None and n != l["new"]:
+                continue
+            if l["old"] is not None and o != l["old"]:
+                continue
+            self.queue.append((l["app"], l["callback"], (entity, attribute, o, n, l["kwargs"])))
+            if l["oneshot"]:
+                self.cancel_listen(handle)
+
+    def fire_event(self, event, data):
+        for handle in list(self.event_listeners.get(event, [])):
+            l = self.listeners.get(handle)
+            if l is None:
+                continue
+            if any(data.get(k) != v for k, v in l["kwargs"].items()):
+                continue
+            self.queue.append((l["app"], l["callback"], (event, data, l["kwargs"])))
+
+    def cancel_listen(self, handle):
+        l = self.listeners.pop(handle, None)
+        if l is None:
+            return False
+        table = self.event_listeners if l["type"] == "event" else self.state_listeners
+        table[l["key"]].remove(handle)
+        return True
+
+    def drain(self):
+        # Deliver queued callbacks, including any queued by the callbacks themselves
+        if self.dispatching:
+            return
+        self.dispatching = True
+        try:
+            while self.queue:
+                app, callback, args = self.queue.popleft()
+                if not app.name in self.apps:
+                    continue
+                self.stats[app.name]["callbacks"] += 1
+                self.call(app, callback, *args)
+        finally:
+            self.dispatching = False
+
+    #
+    # Services
+    #
+
+    def service(self, app, service, data):
+        self.stats[app.name]["services"] += 1
+        self.actions.append((self.now, app.name, service, data))
+
+        domain, action = service.split("/", 1)
+        if action in STATE_ACTIONS and not domain in SWITCHABLE_DOMAINS:
+            self.errors.append((app.name, "Service {0} doesn't exist in HA".format(service)))
+            return
+        entities = data.get("entity_id")
+        if entities is None or not action in STATE_ACTIONS:
+            return
+        if isinstance(entities, str):
+            entities = [entities]
+
+        for entity in entities:
+            current = self.states.get(entity)
+            if entity.startswith("scene.") and action == "turn_on":
+                # Activating a scene turns on the lights it contains
+                if current is not None:
+                    for light in current["attributes"].get("entity_id", []):
+                        self.set_state(light, "on")
+                continue
+            if action == "toggle":
+                state = "off" if current is not None and current["state"] == "on" else "on"
+            else:
+                state = "on" if action == "turn_on" else "off"
+            attributes = {k: v for k, v in data.items() if k != "entity_id"}
+            self.set_state(entity, state, attributes)
+
+    #
+    # Scheduler
+    #
+
+    def schedule(self, app, callback, when, interval, kwargs):
+        self.seq += 1
+        handle = "timer-{0}".format(self.seq)
+        self.timer_info[handle] = {"app": app, "callback": callback, "interval": interval, "kwargs": kwargs, "when": when}
+        heapq.heappush(self.timers, (when, self.seq, handle))
+        self.stats[app.name]["timers"] += 1
+        return handle
+
+    def cancel_timer(self, app, handle):
+        if self.timer_info.pop(handle, None) is not None:
+            self.stats[app.name]["cancels"] += 1
+            return True
+        return False
+
+    def advance(self, seconds):
+        self.run_until(self.now + seconds)
+
+    def run_until(self, end):
+        # Runs every timer due before end in order, then moves the clock to end
+        while self.timers and self.timers[0][0] <= end:
+            when, seq, handle = heapq.heappop(self.timers)
+            timer = self.timer_info.get(handle)
+            if timer is None or timer["when"] != when:
+                continue # Cancelled
+            self.now = max(self.now, when)
+            if timer["interval"]:
+                timer["when"] = when + timer["interval"]
+                heapq.heappush(self.timers, (timer["when"], seq, handle))
+            else:
+                del self.timer_info[handle]
+            self.queue.append((timer["app"], timer["callback"], (timer["kwargs"],)))
+            self.drain()
+        self.now = max(self.now, end)
+
+    def iso(self):
+        return datetime.datetime.fromtimestamp(self.now).isoformat()
+
+    def datetime(self):
+        return datetime.datetime.fromtimestamp(self.now)
+
+    #
+    # Reporting
+    #
+
+    def totals(self):
+        total = collections.Counter()
+        for counter in self.stats.values():
+            total.update(counter)
+        return total
+
+
+class Hass:
+    # Minimal hassapi.Hass, only the calls the apps in this repo use
+
+    def __init__(self, ha, name, args):
+        self.ha = ha
+        self.name = name
+        self.args = args
+        self.config_dir = "."
+
+    def initialize(self):
+        pass
+
+    def count(self, key, n=1):
+        self.ha.stats[self.name][key] += n
+
+    # Logging
+
+    def log(self, msg, *args, **kwargs):
+        if not self.ha.quiet:
+            print("{0} {1}: {2}".format(self.ha.iso(), self.name, msg))
+
+    def error(self, msg, *args, **kwargs):
+        self.count("log_errors")
+        self.log("ERROR " + str(msg))
+
+    def warning(self, msg, *args, **kwargs):
+        self.log("WARNING " + str(msg))
+
+    # State
+
+    @api
+    def get_state(self, entity_id=None, attribute=None, default=None, copy=True, **kwargs):
+        self.count("reads")
+        if entity_id is None:
+            self.count("dumps")
+            return {e: {"entity_id": e, "state": s["state"], "attributes": dict(s["attributes"]), "last_changed": s["last_changed"]}
+                    for e, s in self.ha.states.items()}
+        state = self.ha.states.get(entity_id)
+        if state is None:
+            return default
+        if attribute == "all":
+            return state
+        if attribute is None:
+            return state["state"]
+        return state["attributes"].get(attribute, default)
+
+    @api
+    def set_state(self, entity_id, state=None, attributes=None, **kwargs):
+        self.count("writes")
+        self.ha.set_state(entity_id, state, attributes, replace=kwargs.get("replace", False))
+
+    def entity_exists(self, entity_id, **kwargs):
+        return entity_id in self.ha.states
+
+    @api
+    def listen_state(self, callback, entity_id=None, attribute=None, new=None, old=None, oneshot=False, **kwargs):
+        self.count("listens")
+        return self.add_listener("state", entity_id, callback, {"attribute": attribute, "new": new, "old": old, "oneshot": oneshot}, kwargs)
+
+    @api
+    def listen_event(self, callback, event=None, **kwargs):
+        self.count("listens")
+        return self.add_listener("event", event, callback, {}, kwargs)
+
+    def add_listener(self, type, key, callback, options, kwargs):
+        self.ha.seq += 1
+        handle = "listen-{0}".format(self.ha.seq)
+        listener = {"type": type, "key": key, "app": self, "callback": callback, "kwargs": kwargs}
+        listener.update(options)
+        self.ha.listeners[handle] = listener
+        table = self.ha.event_listeners if type == "event" else self.ha.state_listeners
+        table[key].append(handle)
+        return handle
+
+    @api
+    def cancel_listen_state(self, handle):
+        return self.ha.cancel_listen(handle)
+
+    @api
+    def cancel_listen_event(self, handle):
+        return self.ha.cancel_listen(handle)
+
+    @api
+    def fire_event(self, event, **kwargs):
+        self.ha.fire_event(event, kwargs)
+
+    # Services
+
+    @api
+    def call_service(self, service, return_result=False, **kwargs):
+        # A failed service isn't raised, AppDaemon logs it and returns. return_result gets the result dict
+        self.ha.service(self, service, kwargs)
+        if service in self.ha.failing:
+            self.error("Service call {0} failed".format(service))
+            result = {"success": False, "error": "{0} failed".format(service)}
+        else:
+            result = {"success": True}
+        if return_result:
+            return result
+
+    @api
+    def turn_on(self, entity_id, **kwargs):
+        self.call_service("{0}/turn_on".format(domain_of(entity_id)), entity_id=entity_id, **kwargs)
+
+    @api
+    def turn_off(self, entity_id, **kwargs):
+        self.call_service("{0}/turn_off".format(domain_of(entity_id)), entity_id=entity_id, **kwargs)
+
+    @api
+    def toggle(self, entity_id, **kwargs):
+        self.call_service("{0}/toggle".format(domain_of(entity_id)), entity_id=entity_id, **kwargs)
+
+    @api
+    def notify(self, message, **kwargs):
+        name = kwargs.get("name", "notify")
+        self.call_service("notify/{0}".format(name), message=message, title=kwargs.get("title"))
+
+    # Scheduler
+
+    @api
+    def run_in(self, callback, delay, **kwargs):
+        return self.ha.schedule(self, callback, self.ha.now + delay, None, kwargs)
+
+    @api
+    def run_every(self, callback, start, interval, **kwargs):
+        if start == "now":
+            when = self.ha.now
+        elif isinstance(start, datetime.datetime):
+            when = start.timestamp()
+        else:
+            when = self.ha.now + float(start)
+        return self.ha.schedule(self, callback, when, interval, kwargs)
+
+    @api
+    def run_daily(self, callback, start, **kwargs):
+        if isinstance(start, str):
+            start = datetime.time.fromisoformat(start)
+        now = self.ha.datetime()
+        when = datetime.datetime.combine(now.date(), start)
+        if when <= now:
+            when += datetime.timedelta(days=1)
+        return self.ha.schedule(self, callback, when.timestamp(), 86400, kwargs)
+
+    @api
+    def cancel_timer(self, handle):
+        return self.ha.cancel_timer(self, handle)
+
+    def timer_running(self, handle):
+        return handle in self.ha.timer_info
+
+    # Time
+
+    @api
+    def datetime(self, *args, **kwargs):
+        return self.ha.datetime()
+
+    @api
+    def get_now(self, *args, **kwargs):
+        return self.ha.datetime()
+
+    @api
+    def get_now_ts(self, *args, **kwargs):
+        return self.ha.now
+
+    def time(self):
+        return self.ha.datetime().time()
+
+    @api
+    def render_template(self, template, **kwargs):
+        # Only integration_entities('name') is supported
+        self.count("reads")
+        match = re.search(r"integration_entities\(['\"](\w+)['\"]\)", template)
+        if match is None:
+            raise ValueError("fakehass can't render template: " + template)
+        return str(sorted(self.ha.integrations.get(match.group(1), ())))
+
+    # HTTP endpoints
+
+    def register_endpoint(self, callback, endpoint=None, **kwargs):
+        name = endpoint or self.name
+        self.ha.endpoints[name] = (self, callback)
+        return name
+
+    def unregister_endpoint(self, handle):
+        self.ha.endpoints.pop(handle, None)
+
+    # Other apps
+
+    def get_app(self, name):
+        return self.ha.apps.get(name)
+
+
+def domain_of(entity_id):
+    if isinstance(entity_id, (list, tuple)):
+        entity_id = entity_id[0]
+    return entity_id.split(".", 1)[0]
+
+
+def install():
+    # Make "import hassapi" inside the apps resolve to this module
+    sys.modules["hassapi"] = sys.modules[__name__]
+
+
+class Request:
+    # Enough of aiohttp's web.Request for the endpoint handlers
+    def __init__(self, body=None, query=None):
+        self.body = body
+        self.query = dict(query or {})
+        self.can_read_body = body is not None
+
+    async def json(self):
+        return self.body
@@ -0,0 +1,147 @@
+import argparse
+import datetime
+import difflib
+import os
+import sys
+import tempfile
+
+import bench
+import fakehass
+
+bench.load_apps() # Puts ../apps on the path
+import recorder
+
+#
+# Replays a recording made by the recorder mixin (apps/recorder.py) through one app and compares what it does
+#
+# The app is started against fakehass.FakeHA with the state dump and args from the recording header, the
+# recorded state changes and events are replayed at their recorded (virtual) times as fast as possible,
+# and the actions the app takes are diffed against the recorded ones. Timers aren't replayed, they run
+# from the virtual clock like they did in HA.
+#
+#   python replay_recording.py recordings/living_room_lights.rec
+#   python replay_recording.py living_room_lights.rec --module motion_lights --class MotionLights
+#
+# Exits with 1 if the actions differ. The recorder starts a new header every time the app starts, only one
+# of those runs is replayed, the last one unless --run picks another (0 is the first).
+#
+# Entity index updates aren't in the recording (only the changes of entities the app listens to are), so
+# results can differ for apps that react to index changes of other entities (new scenes, new sensors).
+
+
+def load_runs(path):
+    # Splits a recording into runs of the app, [(header, records)]
+    runs = []
+    for record in recorder.read_records(path):
+        if record[0] == "h":
+            runs.append((record, []))
+        elif runs:
+            runs[-1][1].append(record)
+    return runs
+
+
+def apply(ha, record):
+    # Turns a recorded callback into the state change that caused it, skipped if the state already matches
+    if record[0] == "s":
+        kind, ts, entity, attribute, old, new = record
+        sync(ha, entity, attribute, old)
+        current = ha.states.get(entity)
+        if attribute == "all":
+            apply_state(ha, entity, new)
+        elif attribute is None or attribute == "state":
+            if new is None:
+                ha.remove_state(entity)
+            elif current is None or current["state"] != new:
+                ha.set_state(entity, new)
+        elif current is None or current["attributes"].get(attribute) != new:
+            ha.set_state(entity, attributes={attribute: new})
+    elif record[0] == "e":
+        kind, ts, event, data = record
+        if event == "state_changed":
+            apply_state(ha, data.get("entity_id"), data.get("new_state"))
+        else:
+            ha.fire_event(event, data)
+            ha.drain()
+
+
+def sync(ha, entity, attribute, old):
+    # Changes the app didn't listen for (a door closing when it only listens for "on") aren't in the recording.
+    # The state the callback saw as old is put back without any callbacks, so the recorded change is a change again
+    current = ha.states.get(entity)
+    if current is None or old is None or attribute == "all":
+        return
+    if attribute is None or attribute == "state":
+        current["state"] = old
+    else:
+        current["attributes"][attribute] = old
+
+
+def apply_state(ha, entity, new):
+    current = ha.states.get(entity)
+    if new is None:
+        ha.remove_state(entity)
+    elif current is None or current["state"] != new.get("state") or current["attributes"] != new.get("attributes", {}):
+        ha.set_state(entity, new.get("state"), new.get("attributes", {}), replace=True)
+
+
+def action_lines(records, start):
+    # Actions as comparable text lines, with times relative to the start of the recording
+    return ["{0:10.1f}  {1} {2}".format(r[1] - start, r[2], recorder.encode(r[3])) for r in records if r[0] == "a"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay an app recording and diff the actions")
+    parser.add_argument("recording")
+    parser.add_argument("--module", help="App module, defaults to the one in the recording")
+    parser.add_argument("--class", dest="cls", help="App class, defaults to the one in the recording")
+    parser.add_argument("--run", type=int, default=-1, help="Run of the app to replay, defaults to the last one")
+    parser.add_argument("--verbose", action="store_true", help="Print app logs")
+    options = parser.parse_args(argv)
+
+    runs = load_runs(options.recording)
+    if not runs:
+        parser.error("no header in " + options.recording)
+    header, records = runs[options.run]
+    ts, info = header[1], header[2]
+    module = options.module or info.get("module")
+    cls = options.cls or info.get("class")
+    if not (module and cls):
+        parser.error("the recording doesn't name the app module and class, pass --module and --class")
+
+    output = tempfile.mkdtemp(prefix="replay")
+    args = dict(info["args"])
+    args.pop("module", None)
+    args.pop("class", None)
+    args["record"] = output
+    args["state_dir"] = output # Keep saved state (see app_state.py) out of the config folder
+
+    ha = fakehass.FakeHA(start=datetime.datetime.fromtimestamp(ts), quiet=not options.verbose)
+    ha.load(info["states"])
+    ha.create_app(bench.app_class(module, cls), info["app"], args)
+
+    for record in records:
+        ha.run_until(record[1])
+        apply(ha, record)
+    if records:
+        ha.run_until(records[-1][1])
+    ha.shutdown()
+
+    replayed = [r for r in recorder.read_records(os.path.join(output, info["app"] + ".rec")) if r[0] != "h"]
+    expected = action_lines(records, ts)
+    actual = action_lines(replayed, ts)
+
+    print("{0} records replayed through {1}.{2} (run {3} of {4}), {5} recorded actions, {6} replayed actions".format(
+        len(records), module, cls, options.run % len(runs) + 1, len(runs), len(expected), len(actual)))
+    for app, error in ha.errors:
+        print("Error in {0}:\n{1}".format(app, error))
+
+    diff = list(difflib.unified_diff(expected, actual, "recorded", "replayed", lineterm=""))
+    if diff:
+        print("\n".join(diff))
+        return 1
+    print("Actions match")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())